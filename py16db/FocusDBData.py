@@ -6,15 +6,56 @@ import time
 import shutil
 import subprocess
 import glob
+import shlex
 import sqlite3
 import random
+import tempfile
+import urllib.error
+import urllib.request
+import concurrent.futures
 from plentyofbugs import get_n_genomes as gng
-from .shared_methods import get_ave_read_len_from_fastq
+from .shared_methods import get_ave_read_len_from_fastq, run_and_log, \
+    files_matching, get_lines_from_proks
+
+# fasterq-dump is I/O bound past about this many threads; see
+# https://github.com/ncbi/sra-tools/wiki/HowTo:-fasterq-dump
+FASTERQ_DUMP_THREADS = 6
+
+
+ENA_FILEREPORT = str(
+    "https://www.ebi.ac.uk/ena/portal/api/filereport?" +
+    "accession={}&result=read_run&fields=fastq_ftp")
+
 
 class fasterqdumpError(Exception):
     pass
 
 
+def download_url(url, dest, timeout):
+    """ save url to dest, via dest.part so we never leave a truncated dest
+    """
+    part = dest + ".part"
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response, \
+             open(part, "wb") as outf:
+            shutil.copyfileobj(response, outf, 1 << 20)
+    except Exception:
+        if os.path.exists(part):
+            os.remove(part)
+        raise
+    os.rename(part, dest)
+
+
+def staged_copy_is_current(src, staged):
+    """ whether staged is an up to date copy of src, going by size and mtime
+    """
+    if not os.path.exists(staged):
+        return False
+    src_stat, staged_stat = os.stat(src), os.stat(staged)
+    return src_stat.st_size == staged_stat.st_size and \
+        src_stat.st_mtime_ns == staged_stat.st_mtime_ns
+
+
 class FocusDBData(object):
     def __init__(self, dbdir=None, refdir=None,
                  sraFind_data=None, prokaryotes=None,
@@ -75,7 +116,7 @@ class FocusDBData(object):
             glob.glob(os.path.join(self.dbdir, "*/")) if
             "references" not in x and "minikraken" not in  x
         ]
-        logger.info("recreating data DB from %s SRAs" % len(these_sras))
+        logger.info("recreating data DB from %s SRAs", len(these_sras))
         for i, sra_dir in enumerate(these_sras):
             if (i + 1) % 5 == 0:
                 logger.info("  %i of %i", i + 1, len(these_sras))
@@ -132,21 +173,57 @@ class FocusDBData(object):
         if not os.path.exists(self.krakendir):
             cmds = []
             if not os.path.exists(self.dbdir + "mini.tar.gz"):
-                cmds.append(
-                    str(
-                        "wget ftp://ftp.ccb.jhu.edu/pub/data/kraken2_dbs/" +
-                        "minikraken2_v2_8GB_201904_UPDATE.tgz -O {}mini.tar.gz"
-                    ).format(self.dbdir))
-            cmds.append("tar xzf {0}mini.tar.gz -C {0}".format(self.dbdir))
+                cmds.append([
+                    "wget",
+                    "ftp://ftp.ccb.jhu.edu/pub/data/kraken2_dbs/" +
+                    "minikraken2_v2_8GB_201904_UPDATE.tgz",
+                    "-O", self.dbdir + "mini.tar.gz"])
+            cmds.append(["tar", "xzf", self.dbdir + "mini.tar.gz",
+                         "-C", self.dbdir])
             logger.info("Downloading and preparing minikraken2 DB")
             for cmd in cmds:
-                logger.debug(cmd)
-                subprocess.run(
-                    cmd,
-                    shell=sys.platform != "win32",
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    check=True)
+                logger.debug(" ".join(cmd))
+                run_and_log(cmd, self.dbdir + "minikraken2_download.log")
+
+    def stage_kraken2_db(self, logger, shm="/dev/shm"):
+        """ copy the kraken2 db into shared memory, and use it from there
+
+        kraken2 rereads its db for every accession; from a tmpfs that is
+        a memory map of pages that are already resident.  The copy is kept
+        between runs, and only redone for files that have changed.  If there
+        isnt room, keep using the db where it is.  Returns whether the db was
+        staged.
+        """
+        if not os.path.isdir(shm):
+            logger.warning("%s not available; not staging kraken2 db", shm)
+            return False
+        k2d_files = files_matching(self.krakendir, "*.k2d")
+        if len(k2d_files) == 0:
+            logger.warning("No kraken2 db files in %s; not staging it",
+                           self.krakendir)
+            return False
+        dest = os.path.join(
+            shm, "focusDB_" + os.path.basename(os.path.normpath(
+                self.krakendir)), "")
+        to_copy = [x for x in k2d_files if not staged_copy_is_current(
+            x, os.path.join(dest, os.path.basename(x)))]
+        needed = sum(os.path.getsize(x) for x in to_copy)
+        stats = os.statvfs(shm)
+        if needed > stats.f_bavail * stats.f_frsize:
+            logger.warning("Not enough space in %s for the kraken2 db", shm)
+            return False
+        os.makedirs(dest, exist_ok=True)
+        for k2d in to_copy:
+            logger.info("Copying %s to %s", k2d, dest)
+            # other runs could be using the staged db, so copy it in under a
+            # temporary name and swap it in whole.  copy2 keeps the mtime,
+            # which is how we tell if the db has changed since
+            fd, tmp = tempfile.mkstemp(dir=dest, suffix=".tmp")
+            os.close(fd)
+            shutil.copy2(k2d, tmp)
+            os.replace(tmp, os.path.join(dest, os.path.basename(k2d)))
+        self.krakendir = dest
+        return True
 
     def get_focusDB_dir(self):
         if self.dbdir is None:
@@ -249,21 +326,172 @@ class FocusDBData(object):
         # gets just the file name
         if not os.path.exists(self.sraFind_data):
             logger.info("Downloading sraFind Dump")
-            download_sraFind_cmd = str(
-                "wget " + sraFind_results + " -O " + self.sraFind_data)
-            logger.debug(download_sraFind_cmd)
-            subprocess.run(
-                download_sraFind_cmd,
-                shell=sys.platform != "win32",
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                check=True)
+            download_sraFind_cmd = [
+                "wget", sraFind_results, "-O", self.sraFind_data]
+            logger.debug(" ".join(download_sraFind_cmd))
+            run_and_log(download_sraFind_cmd,
+                        self.sraFind_data + ".download.log")
 
     def run_prefetch_data(self, SRA_list, org, logger):
         pass
 
+    def get_ena_fastq_urls(self, SRA, timeout):
+        """ return the urls for the ENA fastq.gz mirror of a single run,
+        or an empty list if ENA doesnt have them
+        """
+        with urllib.request.urlopen(ENA_FILEREPORT.format(SRA),
+                                    timeout=timeout) as response:
+            lines = response.read().decode().strip().split("\n")
+        # we want the header and exactly one run; experiments with several
+        # runs are left for the SRA tools to sort out
+        if len(lines) != 2:
+            return []
+        header, row = lines[0].split("\t"), lines[1].split("\t")
+        if "fastq_ftp" not in header:
+            return []
+        col = header.index("fastq_ftp")
+        if len(row) <= col or row[col].strip() == "":
+            return []
+        return ["https://" + x for x in row[col].strip().split(";")]
+
+    def fetch_fastqs_from_ena(self, SRA, destination, timeout, logger):
+        """ try to get the reads for a run as fastq.gz files from ENA
+
+        This skips converting the .sra entirely, which is usually the
+        slowest part of getting the reads.  Returns False if ENA doesnt have
+        the run (which we remember with a .no_ena file in destination, so we
+        dont ask again) or if the download fails, so the caller can fall back
+        to the SRA tools
+        """
+        no_ena = os.path.join(destination, ".no_ena")
+        if os.path.exists(no_ena):
+            return False
+        try:
+            urls = self.get_ena_fastq_urls(SRA, timeout)
+        except urllib.error.HTTPError as e:
+            # a client error means ENA doesnt know the accession, but rate
+            # limiting or a server error could be fine next time
+            if not 400 <= e.code < 500 or e.code == 429:
+                logger.debug("Error querying ENA for %s: %s", SRA, e)
+                return False
+            logger.debug("ENA doesnt know about %s: %s", SRA, e)
+            urls = []
+        except (urllib.error.URLError, OSError) as e:
+            # dont cache this: it could just be the network
+            logger.debug("Error querying ENA for %s: %s", SRA, e)
+            return False
+        if len(urls) == 0:
+            logger.debug("%s not found on ENA, using the SRA tools", SRA)
+            with open(no_ena, "w"):
+                pass
+            return False
+        dests = [os.path.join(destination, os.path.basename(x)) for x in urls]
+        logger.debug("Downloading %s from ENA", " ".join(urls))
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=len(urls)) as executor:
+                list(executor.map(download_url, urls, dests,
+                                  [timeout for x in urls]))
+        except (urllib.error.URLError, OSError) as e:
+            logger.warning("Error downloading %s from ENA: %s", SRA, e)
+            for dest in dests:
+                if os.path.exists(dest):
+                    os.remove(dest)
+            return False
+        return True
+
+    def fetch_sra_from_s3(self, SRA, sra_dir, log, timeout, logger):
+        """ try to copy the .sra for a run from the public SRA bucket on AWS
+
+        This is typically much faster than prefetch. Returns False if the aws
+        cli isnt available or the copy fails or times out (such as for
+        accessions that arent runs), so the caller can fall back to prefetch
+        """
+        if shutil.which("aws") is None:
+            return False
+        os.makedirs(sra_dir, exist_ok=True)
+        dest = os.path.join(sra_dir, SRA + ".sra")
+        cmd = ["aws", "s3", "cp", "--no-sign-request", "--only-show-errors",
+               "s3://sra-pub-run-odp/sra/{0}/{0}".format(SRA), dest]
+        logger.debug(" ".join(cmd))
+        try:
+            subprocess.run(cmd, stdout=log, stderr=log,
+                           timeout=timeout, check=True)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            logger.debug("Couldnt get %s from S3 (%s), using prefetch", SRA, e)
+            # dont leave a partial copy for fasterq-dump to choke on
+            if os.path.exists(dest):
+                os.remove(dest)
+            return False
+        return True
+
+    def prefetch_and_dump(self, SRA, destination, log, cores, timeout,
+                          logger, memory=None):
+        """ prefetch the .sra file, and convert it locally with fasterq-dump
+
+        Streaming from the network with fasterq-dump is much slower than
+        prefetching first.  fasterq-dump defaults to 6 threads, and I/O
+        limits using more in most cases, so we cap it at FASTERQ_DUMP_THREADS.
+        If given memory (in GB), half of it is split between the threads
+        for sorting.
+        fasterq-dump cant compress its output, so we do that after with pigz.
+        The uncompressed reads are dumped to the temp dir rather than the
+        destination, so the only thing written to the (often networked) data
+        dir is the compressed reads.
+        """
+        sra_dir = os.path.join(destination, "sra", "")
+        # written once the .sra is completely fetched, so that if the dump
+        # fails or times out, a rerun can go straight to converting it
+        fetched = os.path.join(sra_dir, ".fetched")
+        tmpdir = tempfile.mkdtemp(prefix="focusDB_" + SRA + "_")
+        try:
+            if os.path.exists(fetched):
+                logger.debug("using previously fetched .sra for %s", SRA)
+            else:
+                if not self.fetch_sra_from_s3(SRA=SRA, sra_dir=sra_dir,
+                                              log=log, timeout=timeout,
+                                              logger=logger):
+                    cmd = ["prefetch", "-O", sra_dir, SRA]
+                    logger.debug(" ".join(cmd))
+                    subprocess.run(cmd, stdout=log, timeout=timeout,
+                                   check=True)
+                os.makedirs(sra_dir, exist_ok=True)
+                with open(fetched, "w") as outf:
+                    outf.write(SRA + "\n")
+            # depending on the version, prefetch either writes to
+            # sra_dir/SRA.sra or  sra_dir/SRA/SRA.sra
+            sra_files = glob.glob(os.path.join(sra_dir, "**", SRA + ".sra"),
+                                  recursive=True)
+            threads = min(cores, FASTERQ_DUMP_THREADS)
+            cmd = ["fasterq-dump", "--threads", str(threads),
+                   "--temp", tmpdir, "-O", tmpdir, "--split-files", "-vvv"]
+            if memory is not None:
+                cmd.extend(["--mem", "%iMB" % max(
+                    100, (memory * 1024) // (2 * threads))])
+            cmd.append(sra_files[0] if sra_files else SRA)
+            logger.debug(" ".join(cmd))
+            subprocess.run(cmd, stdout=log, timeout=timeout, check=True)
+            for fastq in files_matching(tmpdir, "*.fastq"):
+                dest_gz = os.path.join(destination,
+                                       os.path.basename(fastq) + ".gz")
+                cmd = ["pigz", "-c", "-p", str(cores), fastq]
+                logger.debug("%s > %s", " ".join(cmd), dest_gz)
+                try:
+                    with open(dest_gz, "wb") as outf:
+                        subprocess.run(cmd, stdout=outf, stderr=log,
+                                       timeout=timeout, check=True)
+                except Exception:
+                    # dont leave a truncated file to be mistaken for reads
+                    os.remove(dest_gz)
+                    raise
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        # we dont need the .sra now that we have the reads
+        shutil.rmtree(sra_dir, ignore_errors=True)
+
     def get_SRA_data(self, SRA, org, logger, timeout, process_partial,
-                     retry_partial, tool="fasterq-dump"):
+                     retry_partial, tool="fasterq-dump", cores=1,
+                     memory=None, ena=True):
         """download_SRA_if_needed
         This doesnt check the manifest right off the bad to make it easier for
         users to move data into the .focusdb dir manually
@@ -272,7 +500,9 @@ class FocusDBData(object):
         2) check manifest; there will be an status message if we removed the
         data intentionally.
         raises an error if it looks like files have gone missing
-        3) rerun if needed, and return the results
+        3) rerun if needed, and return the results; unless ena is False,
+        the reads are fetched from ENA if they are there, skipping the SRA
+        tools entirely
         """
         assert tool in ["fastq-dump", "fasterq-dump"], \
             "unrecognized download tool"
@@ -306,23 +536,27 @@ class FocusDBData(object):
 
         # at this point, data should be ready to be reprocessed
         os.makedirs(suboutput_dir_raw, exist_ok=True)
-        # defaults to 6 threads or whatever is convenient;
-        # we suspect I/O limits using more in most cases,
-        # so we don't give the user the option to increase this
-        # https://github.com/ncbi/sra-tools/wiki/HowTo:-fasterq-dump
         status =  "PASS"
-        verb = "" if tool == "fastq-dump" else "-vvv "
-        cmd = str(
-            "{tool} --gzip -O " +
-            "{suboutput_dir_raw} --split-files {verb}{SRA} > {logfile}"
-        ).format(**locals())
         logger.info("Downloading %s", SRA)
-        logger.debug(cmd)
         try:
-            subprocess.run(cmd,
-                           shell=sys.platform != "win32",
-                           timeout=timeout,
-                           check=True)
+            with open(logfile, "w") as log:
+                if ena and self.fetch_fastqs_from_ena(
+                        SRA=SRA, destination=suboutput_dir_raw,
+                        timeout=timeout, logger=logger):
+                    pass
+                elif tool == "fastq-dump":
+                    cmd = [tool, "--gzip", "-O", suboutput_dir_raw,
+                           "--split-files", SRA]
+                    logger.debug("%s > %s", " ".join(cmd), logfile)
+                    subprocess.run(cmd,
+                                   stdout=log,
+                                   timeout=timeout,
+                                   check=True)
+                else:
+                    self.prefetch_and_dump(
+                        SRA=SRA, destination=suboutput_dir_raw, log=log,
+                        cores=cores, timeout=timeout, logger=logger,
+                        memory=memory)
         except subprocess.CalledProcessError:
             self.update_manifest(
                 newacc=SRA,
@@ -358,9 +592,7 @@ class FocusDBData(object):
         rawreadsf, rawreadsr, download_error_message = \
             self.check_fastq_dir(this_data=suboutput_dir_raw,
                                  mate_as_single=True, logger=logger)
-        read_length = get_ave_read_len_from_fastq(fastq1=rawreadsf,
-                                                  logger=logger)
-        if download_error_message == "":
+        if not download_error_message:
             read_length = get_ave_read_len_from_fastq(fastq1=rawreadsf, logger=logger)
             self.update_manifest(
                 newacc=SRA,
@@ -386,7 +618,7 @@ class FocusDBData(object):
             # this never happens unless a run is aborted;
             # regardless, we want to make sure we attempt to re-download
             return(None, None, "No directory created for SRA during download")
-        fastqs = glob.glob(os.path.join(this_data, "", "*.f*"))
+        fastqs = files_matching(this_data, "*.f*")
         logger.debug("fastqs detected: %s", " ".join(fastqs))
         if len(fastqs) == 0:
             return(None, None, "No fastq files downloaded")
@@ -427,16 +659,17 @@ class FocusDBData(object):
                 else:
                     logger.error(fastqs)
                     download_error_message = "Library error: Unable to process library type"
-        if len(set(rawf)) == 1:
+        nf, nr = len(set(rawf)), len(set(rawr))
+        if nf == 1:
             rawreadsf = rawf[0]
-        elif len(set(rawf)) > 1:
+        elif nf > 1:
             download_error_message = "Library error: multiple forward reads files detected"
         else:
             download_error_message = "Library error: No forward/single read files detected"
 
-        if len(set(rawr)) == 1:
+        if nr == 1:
             rawreadsr = rawr[0]
-        elif len(set(rawr)) > 1:
+        elif nr > 1:
             download_error_message = "Library error: multiple reverse reads files detected"
         else:
             rawreadsr = None
@@ -465,7 +698,7 @@ class FocusDBData(object):
         # it seems counter intuitive, but checking the dir we might have just
         # created is easier than checking if it exists/is intact twice
         os.makedirs(self.refdir, exist_ok=True)
-        ngenomes = len(glob.glob(os.path.join(self.refdir, "*.fna")))
+        ngenomes = len(files_matching(self.refdir, "*.fna"))
         # check how many we need - we need to have at least the number
         #  in args.nstrains. If some exist, we re-rerun with the difference
         if ngenomes == 0 or args.nstrains > ngenomes:
@@ -474,18 +707,18 @@ class FocusDBData(object):
                 org=args.organism_name,
                 nstrains=args.nstrains - ngenomes,
                 thisseed=args.seed,
-                logger=logger)
+                logger=logger,
+                cores=args.cores)
             )
         return 0
 
-    def our_get_n_genomes(self, org, nstrains,  thisseed, logger):
+    def our_get_n_genomes(self, org, nstrains,  thisseed, logger, cores=1):
         # taken from the main function of get_n_genomes
         if self.prokaryotes is None:
             self.prokaryotes = os.path.join(self.dbdir, "prokaryotes.txt")
         if not os.path.exists(self.prokaryotes):
             gng.fetch_prokaryotes(dest=self.prokaryotes)
-        org_lines = gng.get_lines_of_interest_from_proks(
-            path=self.prokaryotes, org=org)
+        org_lines = get_lines_from_proks(path=self.prokaryotes, org=org)
         if len(org_lines) == 0:
             return 1
         if nstrains == 0:
@@ -507,7 +740,7 @@ class FocusDBData(object):
                 # ignore if already there; the last par of the  command is the zipped genome:
                 thisgenome = cmd.split(" ")[-1].replace(".gz", "")
                 if os.path.exists(os.path.join(self.refdir,  thisgenome)):
-                    logger.debug(thisgenome + " already present, skipping")
+                    logger.debug("%s already present, skipping", thisgenome)
                     continue
                 else:
                     fetched = fetched + 1
@@ -515,25 +748,30 @@ class FocusDBData(object):
                                  (i + 1, len(cmds), cmd))
                 logger.debug(cmd)
                 subprocess.run(
-                    cmd,
-                    shell=sys.platform != "win32",
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
+                    shlex.split(cmd),
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
                     check=True)
         except Exception as e:
             logger.error(e)
             return 2
         if fetched == 0:
             return 0
-        for gz in glob.glob(os.path.join(self.refdir, "*.gz")):
-            unzip_cmd = "gunzip " + gz
-            sys.stderr.write(unzip_cmd + "\n")
-            try:
-                subprocess.run(
-                    unzip_cmd,
-                    shell=sys.platform != "win32",
-                    check=True)
-            except Exception as e:
-                logger.error(e)
-                return 3
+        gzs = files_matching(self.refdir, "*.gz")
+        if len(gzs) == 0:
+            return 0
+        # unzip them all in one go, in parallel if we can
+        if shutil.which("pigz") is not None:
+            unzip_cmd = ["pigz", "-d", "-p", str(cores)] + gzs
+        else:
+            unzip_cmd = ["gunzip"] + gzs
+        sys.stderr.write("Unzipping %i genomes\n" % len(gzs))
+        logger.debug(" ".join(unzip_cmd))
+        try:
+            subprocess.run(
+                unzip_cmd,
+                check=True)
+        except Exception as e:
+            logger.error(e)
+            return 3
         return 0
@@ -29,6 +29,10 @@ def get_args():
     parser.add_argument(
         "--addcoli", action="store_true",
         help="Add cannonical MG1655 E coli sequence")
+    parser.add_argument(
+        "--threads", type=int, default=1,
+        help="threads for mafft to use; -1 lets mafft decide. " +
+        "default: %(default)s")
     return(parser.parse_args())
 
 
@@ -81,11 +85,13 @@ TA
     return tmp
 
 
-def mafft(pre, multifasta):
+def mafft(pre, multifasta, threads=1):
     ''' performs default mafft alignment
     '''
     msa = pre + ".mafft"
-    cmd = "mafft --retree 2 --reorder {multifasta} > {msa}".format(**locals())
+    # the alignment goes to stdout, which gets written to msa
+    cmd = ["mafft", "--retree", "2", "--reorder", "--thread", str(threads),
+           multifasta]
     return(msa, cmd)
 
 
@@ -94,14 +100,13 @@ def run_TrimAl(msa):
     '''
     outmsa = msa + ".trimmed"
     outhtml = msa + ".trimmed.html"
-    cmd = str("trimal -in {msa} -htmlout {outhtml} -out {outmsa} " +
-              # "-gappyout" +
-              "-strictplus -keepheader").format(**locals())
-    print(cmd)
+    cmd = ["trimal", "-in", msa, "-htmlout", outhtml, "-out", outmsa,
+           # "-gappyout",
+           "-strictplus", "-keepheader"]
+    print(" ".join(cmd))
     subprocess.run(cmd,
-                   shell=sys.platform !="win32",
-                   stdout=subprocess.PIPE,
-                   stderr=subprocess.PIPE,
+                   stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL,
                    check=True)
     print("Trimming complete")
     return(outmsa)
@@ -124,13 +129,14 @@ def main():
     else:
         multifasta = args.input
 
-    msa, msa_cmd = mafft(pre=args.output_pre, multifasta = multifasta)
-    print(msa_cmd)
-    subprocess.run(msa_cmd,
-                   shell=sys.platform !="win32",
-                   stdout=subprocess.PIPE,
-                   stderr=subprocess.PIPE,
-                   check=True)
+    msa, msa_cmd = mafft(pre=args.out_prefix, multifasta=multifasta,
+                         threads=args.threads)
+    print(" ".join(msa_cmd) + " > " + msa)
+    with open(msa, "w") as outf:
+        subprocess.run(msa_cmd,
+                       stdout=outf,
+                       stderr=subprocess.DEVNULL,
+                       check=True)
     print("MSA complete")
 
     run_TrimAl(msa)
@@ -79,11 +79,11 @@ class test_alignmentData(unittest.TestCase):
             os.remove(ribo16)
         for i  in  range(5):
             if not os.path.exists(self.ecolis[i][0]):
-                getcmd = "{} -O {}.gz".format(self.ecolis[i][1], self.ecolis[i][0])
-                gunzipcmd = "gunzip {}.gz".format(self.ecolis[i][0])
+                getcmd = self.ecolis[i][1].split(" ") + [
+                    "-O", self.ecolis[i][0] + ".gz"]
+                gunzipcmd = ["gunzip", self.ecolis[i][0] + ".gz"]
                 for cmd in [getcmd, gunzipcmd]:
                     subprocess.run(cmd,
-                                   shell=sys.platform != "win32",
                                    check=True)
 
         # ## generates 16s sequences from 5 ecoli genomes
@@ -129,11 +129,12 @@ class test_generate_reads(unittest.TestCase):
         reads = self.artreads
         genome = self.genome = os.path.join(os.path.dirname(__file__), "test_data", "ecoli", "NC_011750.1.fna")
 
-        cmd = "{artdir} -ss HS25 -i {genome} -p -l 150 -f 1 -rs 12345  -m 400 -qs 10 -s 10 -o {reads}".format(**locals())
+        cmd = [artdir, "-ss", "HS25", "-i", genome, "-p", "-l", "150",
+               "-f", "1", "-rs", "12345", "-m", "400", "-qs", "10", "-s", "10",
+               "-o", reads]
 
         subprocess.run(
             cmd,
-            shell=sys.platform !="win32",
             check=True)
 
         freads = os.path.join(self.test_data, "test_reads1.fq")
@@ -141,9 +142,8 @@ class test_generate_reads(unittest.TestCase):
 
         for readfile in [freads, rreads]:
             # -k allows us to keep the  original file
-            gzipcmd = "gzip -k {readfile}".format(**locals())
+            gzipcmd = ["gzip", "-k", readfile]
             subprocess.run(gzipcmd,
-                           shell=sys.platform !="win32",
                            check=True)
 
 
@@ -165,10 +165,9 @@ class sraFind_Test(unittest.TestCase):
         # gets just the file name
         if not os.path.exists(self.sraFind):
             print("Downloading sraFind Dump")
-            download_sraFind_cmd = str("wget " + sraFind_results + " -O " + self.sraFind)
+            download_sraFind_cmd = ["wget", sraFind_results, "-O", self.sraFind]
             subprocess.run(
                 download_sraFind_cmd,
-                shell=sys.platform !="win32",
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 check=True)
@@ -180,12 +179,13 @@ class sraFind_Test(unittest.TestCase):
         sraFind = self.sraFind
         test_sraFind = self.test_sraFind
         org = "Lactobacillus oryzae"
-        cmd = "grep -C5 '{org}' {sraFind} > {test_sraFind}".format(**locals())
+        cmd = ["grep", "-C5", org, sraFind]
 
-        subprocess.run(
-            cmd,
-            shell=sys.platform !="win32",
-            check=True)
+        with open(test_sraFind, "w") as outf:
+            subprocess.run(
+                cmd,
+                stdout=outf,
+                check=True)
 
 
 class parsefile_Test(unittest.TestCase):
@@ -141,11 +141,11 @@ def main():
     tax_dict = parse_kraken_report(kraken2_report=report_output)
     print(report_output)
     barr_gff = os.path.join(tmp, "barrnap_full.gff")
-    subprocess.run("barrnap %s > %s" %(args.contigs, barr_gff),
-                   shell=sys.platform !="win32",
-                   stdout=subprocess.PIPE,
-                   stderr=subprocess.PIPE,
-                   check=True)
+    with open(barr_gff, "w") as outf:
+        subprocess.run(["barrnap", args.contigs],
+                       stdout=outf,
+                       stderr=subprocess.DEVNULL,
+                       check=True)
     this_extracted_seqs = extract_16s_from_assembly(
         args.contigs, barr_gff, sra=args.name,
         output=args.outfile, output_summary=os.path.join(tmp, "summary"), args=args,
@@ -2,7 +2,6 @@
 
 import argparse
 import subprocess
-import sys
 import shutil
 import os
 import subprocess
@@ -70,7 +69,7 @@ def get_args():
 
 
 def make_prefetch_cmd(args, sras):
-    cmd = "prefetch " + " ".join(sras)
+    cmd = ["prefetch"] + sras
     return cmd
 
 
@@ -105,18 +104,16 @@ def main():
         with open(args.output_cmds, "w") as outf:
             for i, cmd in enumerate(cmds):
                 if i % 2 == 0:
-                    outf.write(cmd.replace("prefetch", "prefetch -t https") + "\n")
-                else:
-                    outf.write(cmd + "\n")
+                    cmd = cmd[:1] + ["-t", "https"] + cmd[1:]
+                outf.write(" ".join(cmd) + "\n")
     else:
         ncmds = len(cmds)
         for i, cmd in enumerate(cmds):
             if i % 5 == 0:
                 print("fetching %i of %i" % (i,  ncmds))
             subprocess.run(cmd,
-                           shell=sys.platform != "win32",
-                           stdout=subprocess.PIPE,
-                           stderr=subprocess.PIPE,
+                           stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL,
                            check=True)
 
 
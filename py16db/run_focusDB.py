@@ -6,19 +6,26 @@ import sys
 import os
 import subprocess
 import shutil
-import gzip
 import logging
-import glob
+import logging.handlers
+import json
 import multiprocessing
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import contextlib
+import collections
+import functools
+import threading
+import shlex
+import tempfile
 
-from pathlib import Path
-from Bio import SeqIO
-from Bio.SeqRecord import SeqRecord
 
 from . import __version__
 from py16db.FocusDBData import FocusDBData, fasterqdumpError
 from py16db.shared_methods import filter_sraFind, \
-    extract_16s_from_assembly, run_barrnap, parse_kraken_report, run_kraken2
+    extract_16s_from_assembly, run_barrnap, parse_kraken_report, run_kraken2, \
+    open_fastq, GZ_EXTS, run_and_log, files_matching, \
+    get_ave_read_len_from_fastq, iter_files_matching, write_atomically
 
 
 class bestreferenceError(Exception):
@@ -56,12 +63,26 @@ class extracting16sError(Exception):
     pass
 
 
-class barrnapError(Exception):
+class libraryError(Exception):
     pass
 
 
-class libraryError(Exception):
-    pass
+# {status file path: ((mtime_ns, size), statuses)}; see parse_status_file
+STATUS_CACHE = {}
+
+# {(pid, path): open SUMMARY file}; see summary_handle
+SUMMARY_HANDLES = {}
+
+# {dir being deleted: the background rm doing it}; see discard_dir
+DISCARDS = {}
+
+# how many accessions to keep downloading ahead of the one being processed;
+# each one is a set of raw reads sitting on disk, so dont go crazy
+DOWNLOAD_AHEAD = 2
+
+# how often (in seconds) a queued riboSeed run waiting on a --njobs slot
+# checks whether the run has been aborted; see run_riboSeed_in_slot
+SLOT_POLL = 30
 
 
 def setup_logging(args):  # pragma: nocover
@@ -89,7 +110,11 @@ def setup_logging(args):  # pragma: nocover
     return logger
 
 
-def get_args():  # pragma: nocover
+@functools.lru_cache(maxsize=None)
+def make_parser():  # pragma: nocover
+    """ build the argument parser; only done once, so that parsing the args
+    for several runs from the same process doesnt rebuild it every time
+    """
     parser = argparse.ArgumentParser(
         description="For a given genus or species, " +
         "focusDB orchestrates downloading whole-genome sequencing SRA, " +
@@ -201,6 +226,12 @@ def get_args():  # pragma: nocover
         "instead of RAM for taxonomic assignment. " +
         "automatically enabled if --memory < 20GB",
         required=False)
+    configargs.add_argument(
+        "--kraken_shm", action="store_true",
+        help="copy the kraken2 db to /dev/shm (kept between runs), " +
+        "and memory-map it from there for each accession. " +
+        "Needs as much free shared memory as the db is big",
+        required=False)
     expargs.add_argument(
         "--get_all",
         help="if a biosample is associated with " +
@@ -225,7 +256,9 @@ def get_args():  # pragma: nocover
     jobargs.add_argument(
         "--njobs",
         help="how many jobs to run concurrently " +
-        "via multiprocessing or SGE. --cores and --memory is per job",
+        "via multiprocessing or SGE. --cores and --memory is per job; " +
+        "preparing an accession and assembling one each count as a job, " +
+        "so at most this many of either run at once",
         default=1, type=int)
     jobargs.add_argument(
         "--cores",
@@ -259,11 +292,11 @@ def get_args():  # pragma: nocover
         ": %(default)s")
     jobargs.add_argument(
         "--fastqtool",
-        # help="only fastq-dump, if you need to use fasterq-dump, " +
-        # "for using fasterq-dump, use --focusDB-prefetch",
+        # help="fasterq-dump prefetches the .sra first, and then " +
+        # "converts it locally",
         help=argparse.SUPPRESS,
         default="fastq-dump",
-        choices=["fastq-dump"], #, "fasterq-dump"],
+        choices=["fastq-dump", "fasterq-dump"],
         required=False)
     jobargs.add_argument(
         "--subassembler",
@@ -306,6 +339,11 @@ def get_args():  # pragma: nocover
         "to ensure that you only process partial files of " +
         "sensible size. EXPERTS ONLY",
         required=False, action="store_true")
+    expargs.add_argument(
+        "--no_ena",
+        help="dont try to download reads as fastq.gz from ENA before " +
+        "falling back to fastq-dump/fasterq-dump",
+        required=False, action="store_true")
     expargs.add_argument(
         "--retry_partial",
         help="If a partial download is encountered during " +
@@ -346,8 +384,11 @@ def get_args():  # pragma: nocover
         help="just use any applicable SRAs already downloaded.  " +
         "This can be useful after sraFind updates, and random " +
         "seeding tries to pull other genomes")
+    return parser
 
-    args = parser.parse_args()
+
+def get_args(argv=None):  # pragma: nocover
+    args = make_parser().parse_args(argv)
     if args.sge:
         # just to be safe
         if not args.sge_env.isalnum():
@@ -394,6 +435,39 @@ def get_args():  # pragma: nocover
     return(args)
 
 
+@functools.lru_cache(maxsize=None)
+def which(program):
+    """ shutil.which, but only walking $PATH once per program
+    """
+    return shutil.which(program)
+
+
+def find_programs(programs):
+    """ return {program: path} for the programs found on $PATH.  Each $PATH
+    directory is listed once for the lot, rather than being probed once for
+    every program as shutil.which does
+    """
+    wanted = set(programs)
+    found = {}
+    for directory in os.environ.get("PATH", os.defpath).split(os.pathsep):
+        if not wanted.difference(found):
+            break
+        try:
+            entries = list(os.scandir(directory or os.curdir))
+        except OSError:
+            continue
+        for entry in entries:
+            # first one on $PATH wins, like shutil.which
+            if entry.name not in wanted or entry.name in found:
+                continue
+            try:
+                if entry.is_file() and os.access(entry.path, os.X_OK):
+                    found[entry.name] = entry.path
+            except OSError:
+                continue
+    return found
+
+
 def check_programs(args, logger):
     """exits if the following programs are not installed"""
 
@@ -402,12 +476,13 @@ def check_programs(args, logger):
         args.subassembler, "spades.py",
         "ribo", "barrnap", "fasterq-dump", "mash",
         "sickle", "fastp",
-        "skesa", "plentyofbugs", "seqtk",
+        "skesa", "plentyofbugs", "seqtk", "pigz",
         "kraken2"]
     if args.sge:
         required_programs.append("qsub")
+    found = find_programs(required_programs)
     for program in required_programs:
-        if shutil.which(program) is None:
+        if program not in found:
             logger.critical('%s is not installed: exiting.', program)
             sys.exit(1)
 
@@ -415,41 +490,179 @@ def check_programs(args, logger):
 def parse_status_file(path):
     # because downloading and assembling can fail for many reasons,
     # we write out status to a file.  this allows for easier restarting of
-    # incomplete runs
-    if not os.path.exists(path):
+    # incomplete runs.
+    # The file is a journal: statuses are only ever appended, and a line
+    # starting with "-" removes that status again.
+    # The parsed statuses are cached until the file's mtime or size change,
+    # as the same files get checked over and over while downloading ahead
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        STATUS_CACHE.pop(path, None)
         return []
-    statuses = []
+    key = (st.st_mtime_ns, st.st_size)
+    cached = STATUS_CACHE.get(path)
+    if cached is not None and cached[0] == key:
+        return list(cached[1])
     with open(path, "r") as statusfile:
-        for line in statusfile:
-            statuses.append(line.strip())
+        statuses = replay_status_lines(statusfile)
+    STATUS_CACHE[path] = (key, tuple(statuses))
     return(statuses)
 
 
+def replay_status_lines(lines):
+    """ the statuses left after the additions and removals in lines
+    """
+    statuses = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("-"):
+            if line[1:] in statuses:
+                statuses.remove(line[1:])
+        elif line not in statuses:
+            statuses.append(line)
+    return(statuses)
+
+
+def status_file_has(path, status):
+    """ check for a status without holding onto the whole file
+
+    Most of the time the status just isnt there, which a substring search
+    of the raw file tells us without parsing it.  If it is, it might have
+    been removed again later in the journal, so then we parse it properly.
+    """
+    try:
+        with open(path, "rb") as statusfile:
+            if status.encode() not in statusfile.read():
+                return False
+    except FileNotFoundError:
+        return False
+    return status in parse_status_file(path)
+
+
 def update_status_file(path, to_remove=[], message=None):
-    assert isinstance(to_remove, list)
-    statuses = parse_status_file(path)
-    # dont try to remove empty files
-    if statuses != []:
-        os.remove(path)
-    # just for cleaning up status file
-    if message is not None:
-        statuses.append(message)
-    # write out non-duplicated statuses
-    with open(path, "w") as statusfile:
-        for status in set(statuses):
-            if status not in to_remove:
-                statusfile.write(status + "\n")
+    status = StatusFile(path)
+    status.update(to_remove=to_remove, message=message)
+    status.flush()
+
+
+class StatusFile(object):
+    """ cached copy of an accession's status file
+
+    The file is only read once; checking for a status is just a set lookup.
+    Changes are appended to the file (see parse_status_file) rather than
+    rewriting it, and new statuses are only written out on flush(), so a
+    handful of steps cost a single write.  Removals are written straight
+    away though: they happen just before we delete results, and a status
+    claiming a step is complete must never outlive its output.
+    """
+    # rewrite the journal once it has this many more lines than statuses
+    compact_after = 50
+
+    def __init__(self, path):
+        self.path = path
+        self.pending = []
+        lines = []
+        if os.path.exists(path):
+            with open(path, "r") as statusfile:
+                lines = statusfile.readlines()
+        statuses = replay_status_lines(lines)
+        self.statuses = set(statuses)
+        # dont glue our first entry onto an unterminated last line
+        self.needs_newline = len(lines) > 0 and not lines[-1].endswith("\n")
+        if len(lines) - len(statuses) > self.compact_after:
+            self.compact(statuses)
+
+    def compact(self, statuses):
+        """ replace the journal with just the current statuses
+        """
+        # sorted so that compacted files are the same from run to run
+        keep = sorted(statuses)
+        STATUS_CACHE.pop(self.path, None)
+        write_atomically(self.path, "\n".join(keep) + ("\n" if keep else ""))
+        self.needs_newline = False
+
+    def __contains__(self, status):
+        return status in self.statuses
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def update(self, to_remove=[], message=None):
+        assert isinstance(to_remove, list)
+        # just for cleaning up status file
+        if message is not None and message not in self.statuses:
+            self.statuses.add(message)
+            self.pending.append(message)
+        removed = [x for x in to_remove if x in self.statuses]
+        if removed:
+            self.statuses.difference_update(removed)
+            self.pending.extend(["-" + x for x in removed])
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        STATUS_CACHE.pop(self.path, None)
+        with open(self.path, "a") as statusfile:
+            if self.needs_newline:
+                statusfile.write("\n")
+            statusfile.write("\n".join(self.pending) + "\n")
+        self.pending = []
+        self.needs_newline = False
 
 
 def sralist(list):
     """ takes a file list of  of SRAs, return list
     for if you wish to use SRAs that are very recent and ahead of sraFind
     """
-    sras = []
+    # split() drops any blank lines or stray whitespace for us
     with open(list, "r") as infile:
-        for sra in infile:
-            sras.append(sra.strip())
-    return sras
+        return infile.read().split()
+
+
+def discard_dir(path):
+    """ get rid of a step's old results without waiting for them to be deleted
+
+    riboSeed output in particular can be tens of thousands of files.  The
+    dir is moved aside (instant, as it stays on the same filesystem) so the
+    step can start afresh straight away, and removed with a background rm.
+    Any moved-aside dirs an earlier run didnt get to finish deleting go with
+    it; the rm processes are kept in DISCARDS, see wait_for_discards.
+    """
+    path = os.path.normpath(path)
+    parent, name = os.path.dirname(path), os.path.basename(path)
+    wait_for_discards(block=False)
+    stale = [os.path.join(parent, x) for x in os.listdir(parent) if
+             x.startswith(name + ".old_") and
+             os.path.join(parent, x) not in DISCARDS]
+    trash = tempfile.mkdtemp(prefix=name + ".old_", dir=parent)
+    os.rename(path, os.path.join(trash, name))
+    if which("rm") is None:
+        for d in stale + [trash]:
+            shutil.rmtree(d, ignore_errors=True)
+    else:
+        proc = subprocess.Popen(["rm", "-rf", trash] + stale,
+                                stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL)
+        for d in stale + [trash]:
+            DISCARDS[d] = proc
+
+
+def wait_for_discards(block=True):
+    """ reap the background rms started by discard_dir, waiting for them to
+    finish unless block is False
+    """
+    for d, proc in list(DISCARDS.items()):
+        if block:
+            proc.wait()
+        if proc.poll() is not None:
+            del DISCARDS[d]
 
 
 def pob(genomes_dir, readsf, output_dir, maxdist, logger):
@@ -458,23 +671,21 @@ def pob(genomes_dir, readsf, output_dir, maxdist, logger):
     find the best reference genome for draft genome
     """
 
-    pobcmd = str("plentyofbugs -g {genomes_dir} -f {readsf} -o {output_dir} " +
-                 "--downsampling_ammount 1000000").format(**locals())
-    logger.info('Finding best reference genome: %s', pobcmd)
+    pobcmd = ["plentyofbugs", "-g", genomes_dir, "-f", readsf,
+              "-o", output_dir, "--downsampling_ammount", "1000000"]
+    logger.info('Finding best reference genome: %s', " ".join(pobcmd))
 
+    # plentyofbugs wants to make output_dir itself, so log beside it
+    pob_log = os.path.normpath(output_dir) + ".log"
+    os.makedirs(os.path.dirname(pob_log), exist_ok=True)
     for command in [pobcmd]:
-        logger.debug(command)
         try:
-            subprocess.run(command,
-                           shell=sys.platform != "win32",
-                           stdout=subprocess.PIPE,
-                           stderr=subprocess.PIPE,
-                           check=True)
+            run_and_log(command, pob_log)
             best_ref = os.path.join(output_dir, "best_reference")
         except Exception as e:
             logger.error(e)
             raise bestreferenceError(
-                "Error running the following command: %s" % command)
+                "Error running the following command: %s" % " ".join(command))
 
     with open(best_ref, "r") as infile:
         for line in infile:
@@ -487,16 +698,13 @@ def pob(genomes_dir, readsf, output_dir, maxdist, logger):
                     "Reference similarity %s does not meet %s threshold" %
                     (sim, maxdist))
             length_path = os.path.join(output_dir, "genome_length")
-            cmd = "wc -c {ref} > {length_path}".format(**locals())
-            subprocess.run(cmd,
-                           shell=sys.platform != "win32",
-                           stdout=subprocess.PIPE,
-                           stderr=subprocess.PIPE,
-                           check=True)
+            # same format as `wc -c`, which this used to call
+            with open(length_path, "w") as outf:
+                outf.write("{} {}\n".format(os.path.getsize(ref), ref))
             return(ref, sim)
 
 
-def check_rDNA_copy_number(ref, output, logger):
+def check_rDNA_copy_number(ref, output, logger, cores=1):
     """ensure reference has multiple rDNAs
     Using barrnap to check that there are multiple rDNA copies
     in the reference genome
@@ -504,21 +712,65 @@ def check_rDNA_copy_number(ref, output, logger):
     os.makedirs(os.path.join(output, "barrnap_reference"), exist_ok=True)
     barroutput = os.path.join(output, "barrnap_reference",
                               os.path.basename(ref) + ".gff")
-    cmd = "barrnap {ref} > {barroutput}".format(**locals())
-    subprocess.run(cmd,
-                   shell=sys.platform != "win32",
-                   stdout=subprocess.PIPE,
-                   stderr=subprocess.PIPE,
-                   check=True)
-    rrn_num = 0
-    with open(barroutput, "r") as rrn:
-        for rawline in rrn:
-            line = rawline.strip().split('\t')
-            if line[0].startswith("##"):
-                continue
-            if line[8].startswith("Name=16S"):
-                rrn_num += 1
-    return rrn_num
+    with open(barroutput, "w") as outf:
+        subprocess.run(["barrnap", "--quiet", "--threads", str(cores), ref],
+                       stdout=outf,
+                       stderr=subprocess.DEVNULL,
+                       check=True)
+    # barrnap puts Name first in the attributes (the last column), so this
+    # only matches 16S records, never the ## comment lines
+    with open(barroutput, "rb") as rrn:
+        return rrn.read().count(b"\tName=16S")
+
+
+def cached_rDNA_copy_number(ref, output, logger, cores=1):
+    """ check_rDNA_copy_number, but remembering the results for each reference
+    in output/rDNA_counts.json so barrnap only gets rerun for new or
+    changed genomes
+    """
+    return cached_rDNA_copy_numbers([ref], output, logger, cores)[ref]
+
+
+def cached_rDNA_copy_numbers(refs, output, logger, cores=1):
+    """ cached_rDNA_copy_number for a list of references, returning a dict
+    of {ref: count}.  The uncached ones are run in parallel; barrnap does the
+    work, so threads are enough.  The cache is only read and written once.
+
+    The cache is {path: [mtime, size, count]}, so a changed reference
+    replaces its old entry rather than piling up next to it
+    """
+    cache_path = os.path.join(output, "rDNA_counts.json")
+    cache = {}
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, "r") as inf:
+                cache = json.load(inf)
+        except ValueError:
+            logger.warning("ignoring malformed rDNA cache %s", cache_path)
+    # drop any entries left over from the old {path\tmtime\tsize: count} format
+    cache = {k: v for k, v in cache.items() if isinstance(v, list)}
+    stats = {}
+    for ref in refs:
+        st = os.stat(ref)
+        stats[ref] = [os.path.abspath(ref), st.st_mtime, st.st_size]
+    todo = [ref for ref in refs if
+            cache.get(stats[ref][0], [None])[:2] != stats[ref][1:]]
+    logger.debug("using cached rDNA counts for %i of %i references",
+                 len(refs) - len(todo), len(refs))
+    if todo:
+        # spread the cores between the genomes before giving barrnap threads
+        workers = min(cores, len(todo))
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers) as executor:
+            counts = executor.map(
+                functools.partial(check_rDNA_copy_number, output=output,
+                                  logger=logger,
+                                  cores=max(1, cores // workers)),
+                todo)
+            for ref, rrn_num in zip(todo, counts):
+                cache[stats[ref][0]] = stats[ref][1:] + [rrn_num]
+        write_atomically(cache_path, json.dumps(cache))
+    return {ref: cache[stats[ref][0]][2] for ref in refs}
 
 
 def check_read_len(read_len, minlen, maxlen, logger=None):
@@ -535,41 +787,130 @@ def check_read_len(read_len, minlen, maxlen, logger=None):
 
 
 
-def get_coverage(read_length, approx_length, fastq1, fastq2, logger):
-    """Obtains the coverage for a read set given the estimated genome size"""
-    if os.path.splitext(fastq1)[-1] in ['.gz', '.gzip']:
-        open_fun = gzip.open
+@contextlib.contextmanager
+def fastq_stream(fastq, cores=1):
+    """ binary handle to the contents of a (possibly gzipped) fastq
+
+    Gzipped files are decompressed with pigz if we have it, as python's
+    gzip is single threaded and ends up being the bottleneck
+    """
+    if fastq.endswith(GZ_EXTS) and which("pigz") is not None:
+        proc = subprocess.Popen(["pigz", "-dc", "-p", str(cores), fastq],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL,
+                                bufsize=1 << 20)
+        data = proc.stdout
     else:
-        open_fun = open
+        proc = None
+        data = open_fastq(fastq)
+    try:
+        with data:
+            yield data
+    finally:
+        if proc is not None:
+            proc.wait()
+    if proc is not None and proc.returncode != 0:
+        raise downsamplingError(
+            "Error decompressing %s with pigz; exit code %i" %
+            (fastq, proc.returncode))
+
+
+def count_newlines(fastq, cores=1):
+    """ count the lines in a (possibly gzipped) fastq, including a last
+    line without a trailing newline
+    """
+    count = 0
+    last = b"\n"
+    # reading into the same buffer saves allocating a new block every read
+    buf = bytearray(1 << 20)
+    with fastq_stream(fastq, cores=cores) as data:
+        while True:
+            nbytes = data.readinto(buf)
+            if not nbytes:
+                break
+            count += buf.count(b"\n", 0, nbytes)
+            last = buf[nbytes - 1:nbytes]
+    if last != b"\n":
+        count += 1
+    return count
+
+
+def get_coverage(read_length, approx_length, fastq1, fastq2, logger,
+                 cores=1):
+    """Obtains the coverage for a read set given the estimated genome size
+
+    read_length is the length as downloaded; trimming makes the reads
+    shorter than that, and not always by the same amount for each mate, so
+    both are measured on the files themselves.
+    """
     logger.debug("Counting reads")
-
-    with open_fun(fastq1, "rt") as data:
-        for count, line in enumerate(data):
-            pass
-
+    nreads = count_newlines(fastq1, cores=cores) // 4
+    read_length1 = get_ave_read_len_from_fastq(fastq1, logger=logger)
+    logger.debug("Forward read length: %s (%s before trimming)",
+                 read_length1, read_length)
+    bases = nreads * read_length1
     if fastq2 is not None:
-        read_length = read_length * 2
+        # Trimming keeps the pairs in sync, so there are as many reverse
+        # reads as forward ones; no need for another full pass
+        read_length2 = get_ave_read_len_from_fastq(fastq2, logger=logger)
+        logger.debug("Reverse read length: %s", read_length2)
+        bases = bases + (nreads * read_length2)
 
-    coverage = float((count * read_length) / (approx_length * 4))
+    coverage = float(bases / approx_length)
     logger.info('Read coverage: %sx', round(coverage, 1))
     return(coverage)
 
 
+def run_seqtk_sample(fastq, covfrac, destination, cores, logger):
+    """ subsample reads with seqtk, compressing the output with pigz
+    rather than writing out uncompressed fastqs
+    """
+    seqtk_cmd = ["seqtk", "sample", "-s100", fastq, str(covfrac)]
+    pigz_cmd = ["pigz", "-p", str(cores)]
+    logger.debug("%s | %s > %s", " ".join(seqtk_cmd), " ".join(pigz_cmd),
+                 destination)
+    with open(destination, "wb") as outf:
+        seqtk = subprocess.Popen(seqtk_cmd,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
+        pigz = subprocess.run(pigz_cmd,
+                              stdin=seqtk.stdout,
+                              stdout=outf,
+                              stderr=subprocess.PIPE)
+        # let seqtk get a SIGPIPE if pigz exited early
+        seqtk.stdout.close()
+        seqtk_err = seqtk.stderr.read()
+        seqtk.stderr.close()
+        seqtk.wait()
+    if seqtk.returncode != 0 or pigz.returncode != 0:
+        logger.error(seqtk_err)
+        logger.error(pigz.stderr)
+        raise downsamplingError(
+            "Error downsampling %s; seqtk exited with %i, pigz with %i" %
+            (fastq, seqtk.returncode, pigz.returncode))
+
+
 def downsample(read_length, approx_length, fastq1, fastq2,
-               mincoverage, maxcoverage, destination, logger, run):
+               mincoverage, maxcoverage, destination, logger, run, cores=1):
     """downsample for optimal assembly
     Given the coverage from coverage(), downsamples the reads if over
     the max coverage set by args.maxcov. Default 50.
     """
     suboutput_dir_downsampled = destination
     downpath1 = os.path.join(suboutput_dir_downsampled,
-                             "downsampledreadsf.fastq")
+                             "downsampledreadsf.fastq.gz")
     downpath2 = None
     if fastq2 is not None:
         downpath2 = os.path.join(suboutput_dir_downsampled,
-                                 "downsampledreadsr.fastq")
+                                 "downsampledreadsr.fastq.gz")
     return_originals = True
     if not run:
+        # runs from older versions wrote out uncompressed reads
+        if not os.path.exists(downpath1) and \
+           os.path.exists(downpath1.replace(".gz", "")):
+            downpath1 = downpath1.replace(".gz", "")
+            if downpath2 is not None:
+                downpath2 = downpath2.replace(".gz", "")
         # if any downsmapled reads are here, return those;
         # othewise, we assume they did not need to be downsmapled
         for f in [downpath1, downpath2]:
@@ -580,8 +921,21 @@ def downsample(read_length, approx_length, fastq1, fastq2,
             return(fastq1, fastq2)
         else:
             return(downpath1, downpath2)
+    # every base in a fastq takes at least two bytes (the base and its
+    # quality score), so the file sizes alone can rule out low coverage
+    # sets without reading them.  get_coverage measures the reads in these
+    # same files, so this bounds what it would find.  No such bound for
+    # compressed files
+    fastqs = [x for x in [fastq1, fastq2] if x is not None]
+    if not any(x.endswith(GZ_EXTS) for x in fastqs):
+        max_coverage = sum(os.path.getsize(x) for x in fastqs) / \
+            (2 * approx_length)
+        if max_coverage < mincoverage:
+            raise coverageError(
+                "at most %sx coverage fails to meet minimum (%s)" %
+                (round(max_coverage, 1), mincoverage))
     coverage = get_coverage(read_length, approx_length,
-                            fastq1, fastq2, logger=logger)
+                            fastq1, fastq2, logger=logger, cores=cores)
     if coverage < mincoverage:
         raise coverageError("%sx coverage fails to meet minimum (%s)" %
                             (coverage, mincoverage))
@@ -589,30 +943,25 @@ def downsample(read_length, approx_length, fastq1, fastq2,
     # for how many reads to retain.  Here we calculate the later based
     # on what we have currently
     covfrac = round(float(maxcoverage / coverage), 3)
-    stk_cmd_p = "seqtk sample -s100"
-    dcmd = "{stk_cmd_p} {fastq1} {covfrac} > {downpath1}".format(**locals())
-    dcmd2 = "{stk_cmd_p} {fastq2} {covfrac} > {downpath2}".format(**locals())
-    # at least downsample the forward/single reads, but add the
-    # other command if using paired reads
-    commands = [dcmd]
     if (coverage > maxcoverage):
         if run:
             os.makedirs(suboutput_dir_downsampled)
             logger.info('Downsampling to %s X coverage', maxcoverage)
+            # at least downsample the forward/single reads, and the
+            # reverse reads too if using paired reads.  seqtk samples with
+            # the same seed, so pairs stay in sync even when the two files
+            # are sampled at the same time
+            to_sample = [(fastq1, downpath1)]
             if fastq2 is not None:
-                commands.append(dcmd2)
-            for command in commands:
-                try:
-                    logger.debug(command)
-                    subprocess.run(command,
-                                   shell=sys.platform != "win32",
-                                   stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE,
-                                   check=True)
-                except Exception as e:
-                    logger.error(e)
-                    raise downsamplingError(
-                        "Error running following command ", command)
+                to_sample.append((fastq2, downpath2))
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=len(to_sample)) as sampler:
+                sampling = [
+                    sampler.submit(run_seqtk_sample, fastq, covfrac,
+                                   dest, cores, logger)
+                    for fastq, dest in to_sample]
+                for result in sampling:
+                    result.result()
         return(downpath1, downpath2)
     else:
         logger.info(
@@ -623,64 +972,55 @@ def downsample(read_length, approx_length, fastq1, fastq2,
 def make_riboseed_cmd(sra, readsf, readsr, cores, subassembler, threads,
                       output, memory, just_seed, sge, skip_control,  logger):
     """Runs riboSeed to reassemble reads """
-    # sge keeps from running mmulitprocessing:
-    serialize = "--serialize " if (memory < 10 or sge) else ""
-    seed_str = "--just_seed " if just_seed else ""
-    skip_control_str = "--skip_control " if skip_control else ""
-
-
-    cmd = str("ribo run -r {sra} -F {readsf} -R {readsr} --cores {cores} " +
-              "--threads {threads} -v 1 -o {output} {serialize}" +
-              "--subassembler {subassembler} {seed_str}{skip_control_str}" +
-              "--stages none " +
-              "--memory {memory}").format(**locals())
-
+    cmd = ["ribo", "run", "-r", sra]
     if readsr is None:
-        cmd = str("ribo run -r {sra} -S1 {readsf} --cores {cores} " +
-                  "--threads {threads} -v 1 -o {output} {serialize}" +
-                  "--subassembler {subassembler} {seed_str}{skip_control_str}" +
-                  "--stages none " +
-                  "--memory {memory}").format(**locals())
+        cmd.extend(["-S1", readsf])
+    else:
+        cmd.extend(["-F", readsf, "-R", readsr])
+    cmd.extend(["--cores", str(cores), "--threads", str(threads), "-v", "1",
+                "-o", output])
+    # sge keeps from running mmulitprocessing:
+    if memory < 10 or sge:
+        cmd.append("--serialize")
+    cmd.extend(["--subassembler", subassembler])
+    if just_seed:
+        cmd.append("--just_seed")
+    if skip_control:
+        cmd.append("--skip_control")
+    cmd.extend(["--stages", "none", "--memory", str(memory)])
     return(cmd)
 
 
-def process_strain(rawreadsf, rawreadsr, read_length, genomes_dir,
-                   this_output, args, logger, status_file, kdir):
-    """return a tuple of the riboSeed cmd and the path to contigs,
-    and the taxonomy according to kraken
+def find_reference_and_taxonomy(rawreadsf, genomes_dir, pob_dir, krak_dir,
+                                args, logger, status, kdir):
+    """ return the closest reference, the kraken2 taxonomy of the
+    plentyofbugs assembly, and the approximate genome length
     """
-    pob_dir = os.path.join(this_output, "plentyofbugs", "")
-    krak_dir = os.path.join(this_output, "kraken2", "")
-    ribo_dir = os.path.join(this_output, "riboSeed", "")
-    sickle_out = os.path.join(this_output, "sickle",  "")
     best_reference = os.path.join(pob_dir, "best_reference")
-
-    # Note thhat the status file is checked before each step.
-    # If a failure occured, all future steps are rerrun
-    # for instance, if trimming has been done, but downsample hasn't,
-    # downsampling and assembly will be run. This is to protect against
-    # files sticking around when they shouldn't
     if not os.path.exists(best_reference):
         logger.debug("Preparing to run plentyofbugs")
         if os.path.exists(pob_dir):
-            shutil.rmtree(pob_dir)
-        pob(genomes_dir=genomes_dir, readsf=rawreadsf,
+            discard_dir(pob_dir)
+        # pob has already parsed (and checked) the best reference for us
+        best_ref_fasta, best_ref_dist = pob(
+            genomes_dir=genomes_dir, readsf=rawreadsf,
             output_dir=pob_dir, maxdist=args.maxdist, logger=logger)
-
-    logger.debug("Parsing closest reference")
-    with open(best_reference, "r") as infile:
-        for line in infile:
-            best_ref_fasta = line.split('\t')[0]
-            best_ref_dist = float(line.split('\t')[1])
+    else:
+        logger.debug("Parsing closest reference")
+        with open(best_reference, "r") as infile:
+            line = infile.readline().split('\t')
+        best_ref_fasta = line[0]
+        best_ref_dist = float(line[1])
+        # maxdist may have changed since plentyofbugs was run
         if args.maxdist < best_ref_dist:
             raise referenceNotGoodEnoughError(
                 "Reference similarity %s does not meet %s threshold" %
                 (best_ref_dist, args.maxdist))
     report_output = krak_dir + "kraken2.report"
-    if "TAXONOMY" not in parse_status_file(status_file) or \
+    if "TAXONOMY" not in status or \
        not os.path.exists(report_output):
         if os.path.exists(krak_dir):
-            shutil.rmtree(krak_dir)
+            discard_dir(krak_dir)
         os.makedirs(krak_dir, exist_ok=True)
         logger.info('Assigning taxonomy with kraken')
         pob_assembly = os.path.join(pob_dir, "assembly", "contigs.fasta")
@@ -690,7 +1030,7 @@ def process_strain(rawreadsf, rawreadsr, read_length, genomes_dir,
                 contigs=pob_assembly,
                 dest_prefix=krak_dir + "kraken2",
                 db=kdir, logger=logger)
-            update_status_file(status_file, message="TAXONOMY")
+            status.update(message="TAXONOMY")
         except Exception as e:
             raise kraken2Error(e)
     else:
@@ -706,30 +1046,63 @@ def process_strain(rawreadsf, rawreadsr, read_length, genomes_dir,
         approx_length = None
         with open(genome_length, "r") as infile:
             for line in infile:
-                approx_length = float(line.split()[0])
+                approx_length = int(line.split()[0])
                 logger.debug("Using genome length: %s", approx_length)
         if approx_length is None:
             raise ValueError("Error running plentyofbugs; " +
                              "database possibly outdated")
     else:
         approx_length = args.approx_length
-    if "TRIMMED" not in parse_status_file(status_file) or \
+    return (best_ref_fasta, tax_dict, approx_length)
+
+
+def process_strain(rawreadsf, rawreadsr, read_length, genomes_dir,
+                   this_output, args, logger, status, kdir):
+    """return a tuple of the riboSeed cmd and the path to contigs,
+    and the taxonomy according to kraken
+    """
+    pob_dir = os.path.join(this_output, "plentyofbugs", "")
+    krak_dir = os.path.join(this_output, "kraken2", "")
+    ribo_dir = os.path.join(this_output, "riboSeed", "")
+    sickle_out = os.path.join(this_output, "sickle",  "")
+    downsampled_dir = os.path.join(this_output, "downsampled")
+
+    # Note thhat the status file is checked before each step.
+    # If a failure occured, all future steps are rerrun
+    # for instance, if trimming has been done, but downsample hasn't,
+    # downsampling and assembly will be run. This is to protect against
+    # files sticking around when they shouldn't
+    if "TRIMMED" not in status or \
        not os.path.exists(os.path.join(sickle_out, "fastp.html")):
         logger.info('Quality trimming reads')
-        update_status_file(status_file,
-                           to_remove=["DOWNSAMPLED", "RIBOSEED COMPLETE"])
+        status.update(to_remove=["TRIMMED", "DOWNSAMPLED",
+                                 "RIBOSEED COMPLETE"])
         if os.path.exists(sickle_out):
-            shutil.rmtree(sickle_out)
+            discard_dir(sickle_out)
     else:
         logger.debug('Skipping trimming, parsing existing results')
-
-    trimmed_fastq1, trimmed_fastq2 = run_trimmer(
+    # trimming only needs the raw reads, so we let sickle and fastp get on
+    # with it while plentyofbugs and kraken2 run
+    trimmer = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    trimming = trimmer.submit(
+        run_trimmer,
         fastq1=rawreadsf,
         fastq2=rawreadsr,
         output_dir=sickle_out,
-        run="TRIMMED" not in parse_status_file(status_file),
+        run="TRIMMED" not in status,
         logger=logger)
-    update_status_file(status_file, message="TRIMMED")
+    try:
+        best_ref_fasta, tax_dict, approx_length = find_reference_and_taxonomy(
+            rawreadsf, genomes_dir, pob_dir, krak_dir, args, logger,
+            status, kdir)
+    except Exception:
+        # let trimming finish before we bail out on this accession
+        trimmer.shutdown(wait=True)
+        raise
+
+    trimmed_fastq1, trimmed_fastq2 = trimming.result()
+    trimmer.shutdown()
+    status.update(message="TRIMMED")
     logger.debug('Quality trimmed f reads: %s', trimmed_fastq1)
     logger.debug('Quality trimmed r reads: %s', trimmed_fastq2)
 
@@ -738,11 +1111,11 @@ def process_strain(rawreadsf, rawreadsr, read_length, genomes_dir,
     #                        "to incorrect metadata about pairing. " +
     #                        "For more information, see Sickle results in " +
     #                        sickle_out)
-    if "DOWNSAMPLED" not in parse_status_file(status_file):
+    if "DOWNSAMPLED" not in status:
         logger.debug('Downsampling reads')
-        update_status_file(status_file, to_remove=["RIBOSEED COMPLETE"])
-        if os.path.exists(os.path.join(this_output, "downsampled")):
-            shutil.rmtree(os.path.join(this_output, "downsampled"))
+        status.update(to_remove=["RIBOSEED COMPLETE"])
+        if os.path.exists(downsampled_dir):
+            discard_dir(downsampled_dir)
     else:
         logger.debug('Skipping downsampling, parsing existing results')
     downsampledf, downsampledr = downsample(
@@ -751,11 +1124,12 @@ def process_strain(rawreadsf, rawreadsr, read_length, genomes_dir,
         fastq2=trimmed_fastq2,
         mincoverage=args.mincov,
         maxcoverage=args.maxcov,
-        destination=os.path.join(this_output, "downsampled"),
+        destination=downsampled_dir,
         read_length=read_length,
+        cores=args.cores,
         logger=logger,
-        run="DOWNSAMPLED" not in parse_status_file(status_file))
-    update_status_file(status_file, message="DOWNSAMPLED")
+        run="DOWNSAMPLED" not in status)
+    status.update(message="DOWNSAMPLED")
     logger.debug('Downsampled f reads: %s', downsampledf)
     logger.debug('Downsampled r reads: %s', downsampledr)
     logger.debug("creating riboSeed command")
@@ -772,25 +1146,25 @@ def process_strain(rawreadsf, rawreadsr, read_length, genomes_dir,
     # do we want to redo the assembly?
     if args.redo_assembly:
         logger.debug("preparing to redo riboSeed")
-        update_status_file(status_file, to_remove=["RIBOSEED COMPLETE"])
+        status.update(to_remove=["RIBOSEED COMPLETE"])
         if os.path.exists(ribo_dir):
             logger.debug("removing previous riboSeed results")
-            shutil.rmtree(ribo_dir)
+            discard_dir(ribo_dir)
     # file that will contain riboseed contigs even if final assembly fails
     ribo_contigs = os.path.join(
         this_output, "riboSeed", "seed",
         "final_long_reads", "riboSeedContigs.fasta")
     donef = os.path.join(os.path.basename(this_output), "SGE_COMPLETE")
-    if "RIBOSEED COMPLETE" not in parse_status_file(status_file):
+    if "RIBOSEED COMPLETE" not in status:
         if os.path.exists(ribo_contigs) or os.path.exists(donef) :
             # after sge run
-            update_status_file(status_file, message="RIBOSEED COMPLETE")
+            status.update(message="RIBOSEED COMPLETE")
             return (None, tax_dict)
         else:
             # print(ribo_dir)
             # sys.exit(1)
             if os.path.exists(ribo_dir):
-                shutil.rmtree(ribo_dir)
+                discard_dir(ribo_dir)
             return(riboseed_cmd, tax_dict)
     else:
         logger.info("Skipping riboSeed")
@@ -842,46 +1216,142 @@ def write_pass_fail(args, stage, status, note):
     """
     path = os.path.join(args.output_dir, "SUMMARY")
     org = args.organism_name
-    with open(path, "a") as failfile:
-        failfile.write("{}\t{}\t{}\t{}\n".format(org, status, stage, note))
+    summary_handle(path).write(
+        "{}\t{}\t{}\t{}\n".format(org, status, stage, note))
 
 
-def run_riboSeed_catch_errors(cmd, acc=None, args=None, status_file=None,
-                              riboSeed_jobs=None):
+def summary_handle(path):
+    """ the SUMMARY file, kept open for appending rather than reopened for
+    every line.  Handles are per process: they are line buffered, so a fork
+    never copies unwritten lines, and appends from several processes dont
+    clobber each other
+    """
+    key = (os.getpid(), path)
+    if key not in SUMMARY_HANDLES:
+        SUMMARY_HANDLES[key] = open(path, "a", buffering=1)
+    return SUMMARY_HANDLES[key]
+
+
+def close_summary(path):
+    """ close this process's handle to a SUMMARY file, if it has one
+    """
+    handle = SUMMARY_HANDLES.pop((os.getpid(), path), None)
+    if handle is not None:
+        handle.close()
+
+
+def run_barrnap_to_gff(assembly, gff, cores=1):
+    """ run barrnap on an assembly, returning the exit code rather than
+    raising so that failures in a pool can be tied back to their SRA
+    """
+    with open(gff, "w") as outf:
+        return subprocess.run(["barrnap", "--quiet", "--threads", str(cores),
+                               assembly],
+                              stdout=outf,
+                              stderr=subprocess.DEVNULL).returncode
+
+
+def extract_16s_to_parts(assembly, gff, sra, prefix, args, singleline,
+                         tax_d, min_length, logger_name):
+    """ extract the 16S seqs of one assembly into its own fasta and summary,
+    so that several assemblies can be processed at once.  Returns the
+    number of seqs (or None if extraction failed), the two files, and
+    any error message.  Loggers cant be pickled on older pythons, so this
+    takes the logger's name rather than the logger itself
+    """
+    logger = logging.getLogger(logger_name)
+    fasta = prefix + "_ribo16s.fasta"
+    summary = prefix + "_sequence_summary.tab"
+    for f in [fasta, summary]:
+        if os.path.exists(f):
+            os.remove(f)
+    try:
+        nseqs = extract_16s_from_assembly(
+            assembly, gff, sra, fasta, summary, args,
+            singleline, tax_d, min_length, logger)
+    except extracting16sError as e:
+        return None, fasta, summary, str(e)
+    return nseqs, fasta, summary, None
+
+
+def append_and_remove(src, dest):
+    """ append the contents of src (if any was written) to dest
+    """
+    if not os.path.exists(src):
+        return
+    with open(src, "rb") as inf, open(dest, "ab") as outf:
+        shutil.copyfileobj(inf, outf)
+    os.remove(src)
+
+
+def submit_riboSeed_job(pool, job, results, args, logger, slots, aborted):
+    """ start the riboSeed run for a prepared accession in pool, adding the
+    future to results.  Does nothing if there is no pool (ie, with SGE we
+    submit them all at the end) or the accession failed during preparation.
+    The run waits for one of the --njobs slots it shares with preparing the
+    other accessions, unless aborted gets set
+    """
+    if pool is None or job is None:
+        return
+    acc, cmd, contigs, sfile, tax_d, _ = job
+    if cmd is not None:
+        logger.debug("queuing riboSeed run for %s", acc)
+    results.append(
+        pool.submit(run_riboSeed_in_slot, slots, aborted, cmd,
+                    args=args, acc=acc, status_file=sfile))
+
+
+def run_riboSeed_in_slot(slots, aborted, cmd, **kwargs):
+    """ run_riboSeed_catch_errors, once one of the --njobs slots is free
+
+    A preparation worker that dies takes its slot with it, so rather than
+    waiting forever, give up (returning 1, like a failed run) if aborted is
+    set while we wait
+    """
+    if cmd is None:
+        return 0
+    while not slots.acquire(timeout=SLOT_POLL):
+        if aborted.is_set():
+            sys.stderr.write("Not running riboSeed for " +
+                             "%s; the run was aborted\n" % kwargs["acc"])
+            return 1
+    try:
+        return run_riboSeed_catch_errors(cmd, **kwargs)
+    finally:
+        slots.release()
+
+
+def run_riboSeed_catch_errors(cmd, acc=None, args=None, status_file=None):
+    """ run riboSeed for acc, returning 0 on success or 1 on failure.  This
+    runs in a pool, so rather than editing the jobs, the return code is the
+    only thing the caller gets back
+    """
     if cmd is None:
-        for j in riboSeed_jobs:
-            if j[0] == acc:
-                j[4] = 0
         return 0
     try:
         sys.stderr.write("Executing riboSeed run for " +
                          "%s in multiprocessed pool\n" % acc)
-        subprocess.run(cmd,
-                       shell=sys.platform != "win32",
-                       stdout=subprocess.PIPE,
-                       stderr=subprocess.PIPE,
-                       check=True)
+        run_and_log(cmd, os.path.join(args.output_dir, acc, "riboSeed.log"))
     except subprocess.CalledProcessError:
-        for j in riboSeed_jobs:
-            if j[0] == acc:
-                j[4] = 1
-
         write_pass_fail(args, status="FAIL",
                         stage=acc,
                         note="Unknown failure running riboSeed")
         return 1
-    for j in riboSeed_jobs:
-        if j[0] == acc:
-            j[4] = 0
     return 0
 
 
 def write_this_config(args, this_config_file):
     args_to_write = ["maxdist", "subassembler", "maxcov"]
     argd = vars(args)
+    config = "".join(["{}:{}\n".format(arg, argd[arg])
+                      for arg in args_to_write])
+    # most reruns use the same settings, so leave the file alone if so
+    if os.path.exists(this_config_file):
+        with open(this_config_file, "r") as inf:
+            if inf.read() == config:
+                return
     with open(this_config_file, "w") as outf:
-        for arg in args_to_write:
-            outf.write("{}:{}\n".format(arg, argd[arg]))
+        outf.write(config)
 
 
 def different_args(args, this_config_file, logger):
@@ -895,8 +1365,8 @@ def different_args(args, this_config_file, logger):
         raise ValueError(
             "No previous config file found %s; rerunning" % this_config_file)
     with open(this_config_file, "r") as f:
-        for line in f:
-            (key, val) = line.strip().split(":")
+        for line in f.read().splitlines():
+            (key, val) = line.split(":", 1)
             old_config_dict[key] = val
     if len(old_config_dict) == 0:
         raise ValueError("Old config file empty; rerunning")
@@ -917,13 +1387,6 @@ def different_args(args, this_config_file, logger):
     return diff_args
 
 
-def add_key_or_increment(d, k):
-    if k in d.keys():
-        d[k] = d[k] + 1
-    else:
-        d[k] = 1
-
-
 def write_sge_script(args, ntorun, riboSeed_jobs, script_path):
     end_message = "Done running assemblies. Rerun focusDB as before to " + \
         "will detect the assemblies and finish processing them.  Exiting.."
@@ -945,7 +1408,7 @@ def write_sge_script(args, ntorun, riboSeed_jobs, script_path):
         if os.path.exists(donef):
             os.remove(donef)
         lines.append(
-            'if [ "%i" -eq "$SGE_TASK_ID" ]; then echo "running %s" ; %s ; echo "DONE" > %s ; fi' %(i + 1, job[0],  job[1], donef))
+            'if [ "%i" -eq "$SGE_TASK_ID" ]; then echo "running %s" ; %s ; echo "DONE" > %s ; fi' %(i + 1, job[0],  " ".join([shlex.quote(x) for x in job[1]]), shlex.quote(donef)))
     with open(script_path, "w") as outf:
         for l in lines:
             outf.write(l + "\n")
@@ -956,9 +1419,9 @@ def run_trimmer(fastq1, fastq2, output_dir, run, logger):
     """ run sickle for read trimming, and then fastp for adapter trimmming/QC,
     return paths to trimmed reads
     """
-    if shutil.which("sickle") is None:
+    if which("sickle") is None:
         raise ValueError("sickle not found in PATH!")
-    if shutil.which("fastp") is None:
+    if which("fastp") is None:
         raise ValueError("fastq not found in PATH!")
     sickle_fastq1 = os.path.join(output_dir, "fastq1_trimmed.fastq")
     sickle_fastq2 = os.path.join(output_dir, "fastq2_trimmed.fastq")
@@ -966,60 +1429,282 @@ def run_trimmer(fastq1, fastq2, output_dir, run, logger):
     new_fastq2 = os.path.join(output_dir, "fastq2_trimmed_noadapt.fastq")
     sickle_fastqs = os.path.join(output_dir, "singles_from_trimming.fastq")
     report_pre = os.path.join(output_dir, "fastp")
+    fastpcmd = ["fastp", "--json", report_pre + ".json",
+                "--html", report_pre + ".html",
+                "--cut_front", "--cut_tail"]
     if fastq2 is None:
         ##since illumina 1.8, quality scores returned to sanger.
-        cmd = str("sickle se -f {fastq1} " +
-                  "-t sanger -o {sickle_fastq1}").format(**locals())
+        cmd = ["sickle", "se", "-f", fastq1,
+               "-t", "sanger", "-o", sickle_fastq1]
         # defaults to adapter trimming
-        fastpcmd = str(
-            "fastp --json {report_pre}.json --html {report_pre}.html " +
-            "--cut_front --cut_tail " +
-            "--in1 {sickle_fastq1}  --out1 {new_fastq1}").format(**locals())
+        fastpcmd.extend(["--in1", sickle_fastq1, "--out1", new_fastq1])
         new_fastq2 = None
     else:
-        cmd = str("sickle pe -f {fastq1} -r {fastq2} -t sanger " +
-                  "-o {sickle_fastq1} -p {sickle_fastq2} " +
-                  "-s {sickle_fastqs}").format(**locals())
-        fastpcmd = str(
-            "fastp --json {report_pre}.json --html {report_pre}.html " +
-            "--cut_front --cut_tail " +
-            "--in1 {sickle_fastq1} --in2 {sickle_fastq2}  " +
-            "--out1 {new_fastq1} --out2 {new_fastq2}").format(**locals())
+        cmd = ["sickle", "pe", "-f", fastq1, "-r", fastq2, "-t", "sanger",
+               "-o", sickle_fastq1, "-p", sickle_fastq2,
+               "-s", sickle_fastqs]
+        fastpcmd.extend(["--in1", sickle_fastq1, "--in2", sickle_fastq2,
+                         "--out1", new_fastq1, "--out2", new_fastq2])
     if run: # or not os.path.exists(new_fastq1):
         if run:
             logger.debug("re-running filtering")
         os.makedirs(output_dir)
+        sickle_log = os.path.join(output_dir, "sickle.log")
         try:
-            logger.debug(cmd)
-            subprocess.run(cmd,
-                           shell=sys.platform !="win32",
-                           stdout=subprocess.PIPE,
-                           stderr=subprocess.PIPE,
-                           check=True)
+            logger.debug(" ".join(cmd))
+            run_and_log(cmd, sickle_log)
         except:
-            cmd = cmd.replace("sanger", "solexa")
+            cmd = ["solexa" if x == "sanger" else x for x in cmd]
             try:
-                logger.debug(cmd)
-                subprocess.run(cmd,
-                               shell=sys.platform !="win32",
-                               stdout=subprocess.PIPE,
-                               stderr=subprocess.PIPE,
-                               check=True)
+                logger.debug(" ".join(cmd))
+                run_and_log(cmd, sickle_log)
             except:
-                raise ValueError("Error executing sickle cmd!")
+                raise ValueError("Error executing sickle cmd! see %s" %
+                                 sickle_log)
         # run fastp to trim adapters
+        fastp_log = os.path.join(output_dir, "fastp.log")
         try:
-            logger.debug(fastpcmd)
-            subprocess.run(fastpcmd,
-                           shell=sys.platform !="win32",
-                           stdout=subprocess.PIPE,
-                           stderr=subprocess.PIPE,
-                           check=True)
+            logger.debug(" ".join(fastpcmd))
+            run_and_log(fastpcmd, fastp_log)
         except:
-            raise ValueError("Error executing fastp cmd!")
+            raise ValueError("Error executing fastp cmd! see %s" % fastp_log)
     return (new_fastq1, new_fastq2)
 
 
+def download_accession(accession, args, fDB, logger):
+    """ returns (readsf, readsr, read_length, error_message) for an accession
+    """
+    return fDB.get_SRA_data(
+        org=args.organism_name,
+        # genus=args.genus,    # TODO if needed
+        # species=args.species
+        SRA=accession,
+        logger=logger,
+        timeout=args.timeout,
+        process_partial=args.process_partial,
+        retry_partial=args.retry_partial,
+        tool=args.fastqtool,
+        cores=args.cores,
+        memory=args.memory,
+        ena=not args.no_ena)
+
+
+class LogForwarder(logging.Handler):
+    """ hands records from worker processes to the logger they were
+    logged to, which deals with levels, formatting, and files
+    """
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+
+def setup_worker_logging(log_queue, name):
+    """ in a worker process, replace the handlers inherited from the main
+    process with one that sends records back to it through log_queue
+    """
+    root = logging.getLogger()
+    if not any(isinstance(h, logging.handlers.QueueHandler)
+               for h in root.handlers):
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+        root.setLevel(logging.DEBUG)
+    logger = logging.getLogger(name)
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+    return logger
+
+
+def process_accession_in_worker(log_queue, logger_name, slots, accession, i,
+                                nsras, args, fDB, updated_args):
+    """ process_accession, logging through the main process, once one of the
+    --njobs slots is free
+    """
+    logger = setup_worker_logging(log_queue, logger_name)
+    with slots:
+        return process_accession(accession, i, nsras, args, fDB,
+                                 updated_args, logger)
+
+
+def process_accession(accession, i, nsras, args, fDB, updated_args, logger,
+                      download=None):
+    """ download, check, and prepare the riboSeed run for a single accession.
+
+    Each accession has its own output dir and status file, so these can be
+    run concurrently.  Returns a tuple of the riboSeed job (or None if the
+    accession was dropped) and the stage at which an error occurred (or None)
+    If the download was already started elsewhere, pass its future as
+    download and we wait on that rather than downloading here.
+    """
+    status_file = os.path.join(args.output_dir, accession, "status")
+    os.makedirs(os.path.dirname(status_file), exist_ok=True)
+    # statuses are flushed to disk when we are done with this accession,
+    # however that might be
+    with StatusFile(status_file) as status:
+        return prepare_accession(accession, i, nsras, args, fDB,
+                                 updated_args, logger, download, status)
+
+
+# how prepare_accession reports the errors process_strain can raise:
+# (exception, status, note, stage recorded in the error counts or None)
+PROCESS_STRAIN_ERRORS = (
+    (coverageError, "FAIL", "Insufficient coverage", None),
+    (bestreferenceError, "ERROR", "Unknown error selecting reference",
+     "plentyofbugs"),
+    (kraken2Error, "ERROR", "Unknown error runing kraken2", "Taxonomy"),
+    (referenceNotGoodEnoughError, "FAIL",
+     "No reference meets threshold for re-assembly", None),
+    (downsamplingError, "ERROR", "Unknown error downsampling",
+     "Downsampling"),
+)
+PROCESS_STRAIN_ERRORS_TYPES = tuple(x[0] for x in PROCESS_STRAIN_ERRORS)
+
+
+def prepare_accession(accession, i, nsras, args, fDB, updated_args, logger,
+                      download, status):
+    """ does the work for process_accession
+    """
+    # trying to troublshoot a potential race condition
+    # deleting all references.
+    assert next(iter_files_matching(fDB.refdir, "*.fna"), None) is not None, \
+        "as of SRA %s (%i of %i), genomes dir empty" % (
+            accession, i + 1, nsras)
+    this_output = os.path.join(args.output_dir, accession)
+    this_results = os.path.join(this_output, "results")
+    # this_output was made by process_accession along with the status file
+    status_file = status.path
+    logger.info("Organism: %s; Accession: %s (%s of %s)",
+                args.organism_name, accession, i + 1, nsras)
+    message = ""
+    # ############### check updated args, update status file if needed
+    # gather up the removals so they get written in one go
+    to_remove = []
+    if "maxdist" in updated_args:
+        to_remove.append("RIBOSEED COMPLETE")
+    if "maxcov" in updated_args:
+        to_remove.extend(["DOWNSAMPLED", "RIBOSEED COMPLETE"])
+    if "subassembler" in updated_args:
+        to_remove.append("RIBOSEED COMPLETE")
+    status.update(to_remove=sorted(set(to_remove)))
+    if "maxdist" in updated_args:
+        # plentyofbugs will rerun if this fileis missing
+        this_pob_results = os.path.join(
+            this_results, "plentyofbugs", "best_reference")
+        if os.path.exists(this_pob_results):
+            os.remove(this_pob_results)
+
+    ################
+    if "RIBOSEED COMPLETE" in status and \
+       not args.redo_assembly:
+        logger.info("using existing results")
+        try:
+            contigs = check_riboSeed_outcome(
+                ribodir=os.path.join(this_results, "riboSeed"),
+                status_file=status_file)
+        except riboSeedUnsuccessfulError as e:
+            status.update(message="RIBOSEED COMPLETE")
+            write_pass_fail(args, status="FAIL",
+                            stage=accession,
+                            note="riboSeed unsuccessful")
+            logger.error(e)
+            return (None, None)
+        # we decide to keep calm and carry on in this case; if you
+        # want to try again, use --redo_assembly
+        except riboSeedError as e:
+            write_pass_fail(args, status="ERROR",
+                            stage=accession,
+                            note="riboSeed Error")
+            logger.error(e)
+            return (None, None)
+        # fast_ribo_contigs = os.path.join(
+        #     this_results, "riboSeed", "seed",
+        #     "final_long_reads", "riboSeedContigs.fasta")
+        # full_ribo_contigs = os.path.join(
+        #     this_results, "riboSeed", "seed",
+        #     "final_de_fere_novo_assembly", "contigs.fasta")
+        kraken2_report_output = os.path.join(
+            this_results, "kraken2", "kraken2.report")
+        # double check files exist before we skip this one
+        # Note that if user first ran in --fast mode, this should
+        # catch the lack of final assembly
+        if not os.path.exists(kraken2_report_output):
+            logger.warning("Kraken2 results not found")
+        elif contigs["full"] is None and not args.fast:
+            logger.warning("Full riboSeed output contigs not found")
+        elif not os.path.exists(contigs["fast"]):
+            logger.warning("Fast riboSeed output contigs not found")
+        else:
+            return ([accession, None, contigs,  status_file,
+                     parse_kraken_report(kraken2_report_output), 0], None)
+        logger.info("Reprocessing SRA")
+
+    try:
+        if download is not None:
+            sra_data = download.result()
+        else:
+            sra_data = download_accession(accession, args, fDB, logger)
+        rawreadsf, rawreadsr, read_length, download_error_message = sra_data
+    except fasterqdumpError:
+        message = 'Error downloading %s' % accession
+        write_pass_fail(
+            args, status="ERROR", stage=accession, note=message)
+        logger.error(message)
+        return (None, "Downloading")
+    if download_error_message:
+        write_pass_fail(args, status="ERROR", stage=accession,
+                        note=download_error_message)
+        logger.error(
+            "Error either downloading or parsing the file " +
+            "name for this accession.")
+        logger.error(download_error_message)
+        return (None, "Downloading")
+    logger.debug("Checking read length")
+    read_len_status = check_read_len(
+        read_len=read_length,
+        minlen=args.minreadlen,
+        maxlen=args.maxreadlen,
+        logger=logger)
+
+    if read_len_status != 0:
+        if read_len_status == 1:
+            message = "Reads under the  %i bp threshold" % args.minreadlen
+        else:
+            message = "Reads over the  %i bp threshold" % args.maxreadlen
+        write_pass_fail(
+            args, status="ERROR", stage=accession, note=message)
+        logger.error(message)
+        return (None, None)
+    #  heres the meat of the main, catching errors for
+    #  anything but the riboSeed step
+    logger.debug("preparing for re-assembly")
+    try:
+        riboSeed_cmd, taxonomy_d = process_strain(
+            rawreadsf, rawreadsr, read_length, fDB.refdir,
+            this_results, args, logger, status, fDB.krakendir)
+        return ([accession, riboSeed_cmd,
+                 None,  status_file, taxonomy_d, None], None)
+    except PROCESS_STRAIN_ERRORS_TYPES as e:
+        for error, fail_status, note, error_stage in PROCESS_STRAIN_ERRORS:
+            if isinstance(e, error):
+                break
+        if error is kraken2Error and not args.kraken_mem_mapping:
+            logger.error("Kraken2 error; try rerunning with " +
+                         "--kraken_mem_mapping")
+        write_pass_fail(args, status=fail_status,
+                        stage=accession,
+                        note=note)
+        logger.error(e)
+        return (None, error_stage)
+    except Exception as e:
+        logger.error(e)
+        logger.error(
+            "Unknown error occured; please raise issue on GitHub " +
+            "attaching the log file found in %s ", this_results
+            )
+        write_pass_fail(args, status="FAIL",
+                        stage=accession,
+                        note="Unknown critial error")
+        return (None, "Unknown")
+
 
 def main():
     args = get_args()
@@ -1027,14 +1712,16 @@ def main():
     if not os.path.exists(args.output_dir):
         os.makedirs(args.output_dir)
     if os.path.exists(os.path.join(args.output_dir, "SUMMARY")):
+        close_summary(os.path.join(args.output_dir, "SUMMARY"))
         os.remove(os.path.join(args.output_dir, "SUMMARY"))
 
     logger = setup_logging(args)
     logger.info("Processing %s", args.organism_name)
-    logger.info("Usage:\n{0}\n".format(" ".join([x for x in sys.argv])))
-    logger.debug("All settings used:")
-    for k, v in sorted(vars(args).items()):
-        logger.debug("{0}: {1}".format(k, v))
+    logger.info("Usage:\n%s\n", " ".join(sys.argv))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("All settings used:")
+        for k, v in sorted(vars(args).items()):
+            logger.debug("%s: %s", k, v)
     check_programs(args, logger)
     # set up the data object
     # grooms path names or uses default location if unset
@@ -1051,6 +1738,9 @@ def main():
     fDB.fetch_sraFind_data(logger=logger)
     logger.debug("checking for minikraken2 db")
     fDB.check_or_get_minikraken2(logger=logger)
+    # a db staged in shared memory is already in RAM, so just map it
+    if args.kraken_shm and fDB.stage_kraken2_db(logger=logger):
+        args.kraken_mem_mapping = True
 
     # process data 1 of 4 ways: specific SRA(s), a file of SRA(s),
     #  specific read file (stored as a faux SRA), or the default
@@ -1081,7 +1771,8 @@ def main():
             thisseed=args.seed,
             use_available=args.use_available,
             logger=logger,
-            get_all=args.get_all)
+            get_all=args.get_all,
+            cache=fDB.sraFind_data + ".cache.json")
     if filtered_sras == []:
         if args.custom_reads is None:
             logger.critical('No SRAs found on NCBI by sraFind')
@@ -1105,8 +1796,6 @@ def main():
         logger.critical(message)
         write_pass_fail(args, status="ERROR", stage="global", note=message)
         sys.exit(1)
-    genome_check_file = os.path.join(fDB.refdir, ".references_passed_checks")
-
     #  Check to see if we have requested a different number of strains
     this_config_file = os.path.join(args.output_dir, "config")
     try:
@@ -1115,28 +1804,26 @@ def main():
         logger.warning(e)
         # if we have any issues finding or reading the config, rerun it all
         updated_args = ["maxdist", "subassembler", "maxcov"]
-    # if "n_references" in updated_args:
-    #     if os.path.exists(genome_check_file):
-    #         os.remove(genome_check_file)
     write_this_config(args, this_config_file)
 
     # #########
-    if not os.path.exists(genome_check_file):
-        logger.info("checking reference genomes for rDNA counts")
-        for pot_reference in glob.glob(os.path.join(fDB.refdir, "*.fna")):
-            rDNAs = check_rDNA_copy_number(ref=pot_reference,
+    # list these once, and keep the list in step with what we delete.
+    # The counts are cached per genome (keyed on its size and mtime), so
+    # this only runs barrnap on references that are new since the last run
+    potential_refs = files_matching(fDB.refdir, "*.fna")
+    logger.info("checking reference genomes for rDNA counts")
+    rDNA_counts = cached_rDNA_copy_numbers(refs=potential_refs,
                                            output=fDB.refdir,
-                                           logger=logger)
-            if rDNAs < 2:
-                logger.warning(
-                    "reference %s does not have multiple rDNAs; excluding",
-                    pot_reference)
-                os.remove(pot_reference)
-        with open(genome_check_file, "w") as statusfile:
-            statusfile.write("References have been checked\n")
-    else:
-        logger.debug("Already checked reference genomes in %s", fDB.refdir)
-    if len(glob.glob(os.path.join(fDB.refdir, "*.fna"))) == 0:
+                                           logger=logger,
+                                           cores=args.cores)
+    for pot_reference in potential_refs[:]:
+        if rDNA_counts[pot_reference] < 2:
+            logger.warning(
+                "reference %s does not have multiple rDNAs; excluding",
+                pot_reference)
+            os.remove(pot_reference)
+            potential_refs.remove(pot_reference)
+    if len(potential_refs) == 0:
         logger.critical("No usable reference genome found!")
         write_pass_fail(args, status="FAIL",
                         stage="global",
@@ -1145,187 +1832,111 @@ def main():
 
     riboSeed_jobs = []  # [accession, cmd, depreciated, status_file, return_code]
     nsras = len(filtered_sras)
-    n_errors = {}
-    for i, accession in enumerate(filtered_sras):
-        # trying to troublshoot a potential race condition
-        # deleting all references.
-        assert len(glob.glob(os.path.join(fDB.refdir, "*.fna"))) != 0, \
-            "as of SRA %s (%i of %i), genomes dir empty" % (
-                accession, i + 1, nsras)
-        this_output = os.path.join(args.output_dir, accession)
-        this_results = os.path.join(this_output, "results")
-        os.makedirs(this_output, exist_ok=True)
-        status_file = os.path.join(this_output, "status")
-        logger.info("Organism: %s; Accession: %s (%s of %s)",
-                    args.organism_name, accession, i + 1, nsras)
-        message = ""
-        # ############### check updated args, update status file if needed
-        if "maxdist" in updated_args:
-            # plentyofbugs will rerun if this fileis missing
-            update_status_file(status_file, to_remove=["RIBOSEED COMPLETE"])
-            this_pob_results = os.path.join(
-                this_results, "plentyofbugs", "best_reference")
-            if os.path.exists(this_pob_results):
-                os.remove(this_pob_results)
-        if "maxcov" in updated_args:
-            update_status_file(status_file,
-                               to_remove=["DOWNSAMPLED", "RIBOSEED COMPLETE"])
-        if "subassembler" in updated_args:
-            update_status_file(status_file, to_remove=["RIBOSEED COMPLETE"])
-
-        ################
-        if "RIBOSEED COMPLETE" in parse_status_file(status_file) and \
-           not args.redo_assembly:
-            logger.info("using existing results")
-            try:
-                contigs = check_riboSeed_outcome(
-                    ribodir=os.path.join(this_results, "riboSeed"),
-                    status_file=status_file)
-            except riboSeedUnsuccessfulError as e:
-                update_status_file(status_file, message="RIBOSEED COMPLETE")
-                write_pass_fail(args, status="FAIL",
-                                stage=accession,
-                                note="riboSeed unsuccessful")
-                logger.error(e)
-                continue
-            # we decide to keep calm and carry on in this case; if you
-            # want to try again, use --redo_assembly
-            except riboSeedError as e:
-                write_pass_fail(args, status="ERROR",
-                                stage=accession,
-                                note="riboSeed Error")
-                logger.error(e)
-                continue
-            # fast_ribo_contigs = os.path.join(
-            #     this_results, "riboSeed", "seed",
-            #     "final_long_reads", "riboSeedContigs.fasta")
-            # full_ribo_contigs = os.path.join(
-            #     this_results, "riboSeed", "seed",
-            #     "final_de_fere_novo_assembly", "contigs.fasta")
-            kraken2_report_output = os.path.join(
-                this_results, "kraken2", "kraken2.report")
-            # double check files exist before we skip this one
-            # Note that if user first ran in --fast mode, this should
-            # catch the lack of final assembly
-            if not os.path.exists(kraken2_report_output):
-                logger.warning("Kraken2 results not found")
-            elif contigs["full"] is None and not args.fast:
-                logger.warning("Full riboSeed output contigs not found")
-            elif not os.path.exists(contigs["fast"]):
-                logger.warning("Fast riboSeed output contigs not found")
-            else:
-                riboSeed_jobs.append(
-                    [accession, None, contigs,  status_file,
-                     parse_kraken_report(kraken2_report_output), 0])
-                continue
-            logger.info("Reprocessing SRA")
-
-        try:
-            rawreadsf, rawreadsr, read_length, download_error_message = \
-                fDB.get_SRA_data(
-                    org=args.organism_name,
-                    # genus=args.genus,    # TODO if needed
-                    # species=args.species
-                    SRA=accession,
-                    logger=logger,
-                    timeout=args.timeout,
-                    process_partial=args.process_partial,
-                    retry_partial=args.retry_partial,
-                    tool=args.fastqtool)
-        except fasterqdumpError:
-            message = 'Error downloading %s' % accession
-            write_pass_fail(
-                args, status="ERROR", stage=accession, note=message)
-            logger.error(message)
-            add_key_or_increment(n_errors, "Downloading")
-            continue
-        if download_error_message != "":
-            write_pass_fail(args, status="ERROR", stage=accession,
-                            note=download_error_message)
-            logger.error(
-                "Error either downloading or parsing the file " +
-                "name for this accession.")
-            logger.error(download_error_message)
-            add_key_or_increment(n_errors, "Downloading")
-            continue
-        logger.debug("Checking read length")
-        read_len_status = check_read_len(
-            read_len=read_length,
-            minlen=args.minreadlen,
-            maxlen=args.maxreadlen,
-            logger=logger)
-
-        if read_len_status != 0:
-            if read_len_status == 1:
-                message = "Reads under the  %i bp threshold" % args.minreadlen
-            else:
-                message = "Reads over the  %i bp threshold" % args.maxreadlen
-            write_pass_fail(
-                args, status="ERROR", stage=accession, note=message)
-            logger.error(message)
-            continue
-        #  heres the meat of the main, catching errors for
-        #  anything but the riboSeed step
-        logger.debug("preparing for re-assembly")
-        try:
-            riboSeed_cmd, taxonomy_d = process_strain(
-                rawreadsf, rawreadsr, read_length, fDB.refdir,
-                this_results, args, logger, status_file, fDB.krakendir)
-            riboSeed_jobs.append(
-                [accession, riboSeed_cmd,
-                 None,  status_file, taxonomy_d, None])
-        except coverageError as e:
-            write_pass_fail(args, status="FAIL",
-                            stage=accession,
-                            note="Insufficient coverage")
-            logger.error(e)
-            continue
-        except bestreferenceError as e:
-            write_pass_fail(args, status="ERROR",
-                            stage=accession,
-                            note="Unknown error selecting reference")
-            logger.error(e)
-            add_key_or_increment(n_errors, "plentyofbugs")
-            continue
-        except kraken2Error as e:
-            if not args.kraken_mem_mapping:
-                logger.error("Kraken2 error; try rerunning with " +
-                             "--kraken_mem_mapping")
-            write_pass_fail(args, status="ERROR",
-                            stage=accession,
-                            note="Unknown error runing kraken2")
-            add_key_or_increment(n_errors, "Taxonomy")
-            logger.error(e)
-            continue
-        except referenceNotGoodEnoughError as e:
-            write_pass_fail(
-                args, status="FAIL",
-                stage=accession,
-                note="No reference meets threshold for re-assembly")
-            logger.error(e)
-            continue
-        except downsamplingError as e:
-            write_pass_fail(args, status="ERROR",
-                            stage=accession,
-                            note="Unknown error downsampling")
-            logger.error(e)
-            add_key_or_increment(n_errors, "Downsampling")
-            continue
-        except Exception as e:
-            logger.error(e)
-            logger.error(
-                "Unknown error occured; please raise issue on GitHub " +
-                "attaching the log file found in %s ", this_results
-                )
-            add_key_or_increment(n_errors, "Unknown")
-            write_pass_fail(args, status="FAIL",
-                            stage=accession,
-                            note="Unknown critial error")
-            continue
+    n_errors = collections.Counter()
+    # preparing an accession and assembling one both want --cores and
+    # --memory, so between them only --njobs run at once.  With worker
+    # processes, the slots (and log queue) live in a manager; it is started
+    # before any threads, so its process doesnt inherit them
+    log_manager = None
+    if args.njobs > 1:
+        log_manager = multiprocessing.Manager()
+        slots = log_manager.BoundedSemaphore(args.njobs)
+    else:
+        slots = threading.BoundedSemaphore(args.njobs)
+    # set if the preparation workers die, so riboSeed runs stop waiting
+    aborted = threading.Event()
+    # rather than waiting for every accession to be prepared, start each
+    # assembly as soon as its reads are ready.  riboSeed does its work in a
+    # subprocess, so threads are enough; they only start with the first
+    # submitted run, by which time the preparation workers have been forked
+    riboSeed_pool = None
+    riboSeed_pool_results = []
+    if not args.sge:
+        riboSeed_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=args.njobs)
+    # accessions are independent, so run --njobs of them at a time
+    if args.njobs > 1:
+        # the workers send their log records back here, so lines from
+        # different processes dont get mangled together in the log file
+        log_queue = log_manager.Queue()
+        log_listener = logging.handlers.QueueListener(
+            log_queue, LogForwarder())
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=args.njobs) as executor:
+            futures = [
+                executor.submit(process_accession_in_worker, log_queue,
+                                logger.name, slots, accession, i, nsras,
+                                args, fDB, updated_args)
+                for i, accession in enumerate(filtered_sras)]
+            # the workers are forked as the jobs are submitted; only start
+            # the listener's thread after that, so no worker can inherit a
+            # logging lock it was holding.  Until then, records just queue up
+            log_listener.start()
+            indices = {future: i for i, future in enumerate(futures)}
+            accession_results = [None for x in futures]
+            for ndone, future in enumerate(
+                    concurrent.futures.as_completed(futures)):
+                i = indices[future]
+                accession = filtered_sras[i]
+                try:
+                    accession_results[i] = future.result()
+                except BrokenProcessPool as e:
+                    # a worker was killed (out of memory, say); the rest of
+                    # the queue fails with it, and any slots held are lost
+                    logger.critical("Preparation worker died: %s", e)
+                    aborted.set()
+                    write_pass_fail(args, status="FAIL",
+                                    stage=accession,
+                                    note="Worker died during preparation")
+                    accession_results[i] = (None, "Unknown")
+                except Exception as e:
+                    logger.error(e)
+                    write_pass_fail(args, status="FAIL",
+                                    stage=accession,
+                                    note="Unknown critial error")
+                    accession_results[i] = (None, "Unknown")
+                logger.info("Finished preparing %s (%i of %i)",
+                            accession, ndone + 1, nsras)
+                submit_riboSeed_job(riboSeed_pool, accession_results[i][0],
+                                    riboSeed_pool_results, args, logger,
+                                    slots, aborted)
+        log_listener.stop()
+    else:
+        # downloading is network bound, so fetch the next accessions in a
+        # thread while this one is trimmed, downsampled, etc
+        accession_results = []
+        downloads = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as downloader:
+            for i, accession in enumerate(filtered_sras):
+                for acc in filtered_sras[i: i + 1 + DOWNLOAD_AHEAD]:
+                    if acc in downloads:
+                        continue
+                    status_file = os.path.join(args.output_dir, acc, "status")
+                    # no need to download what has already been assembled
+                    if status_file_has(status_file, "RIBOSEED COMPLETE") \
+                       and not args.redo_assembly:
+                        downloads[acc] = None
+                        continue
+                    downloads[acc] = downloader.submit(
+                        download_accession, acc, args, fDB, logger)
+                with slots:
+                    accession_results.append(process_accession(
+                        accession, i, nsras, args, fDB, updated_args, logger,
+                        download=downloads.pop(accession, None)))
+                submit_riboSeed_job(riboSeed_pool, accession_results[-1][0],
+                                    riboSeed_pool_results, args, logger,
+                                    slots, aborted)
+    for job, error_stage in accession_results:
+        if job is not None:
+            riboSeed_jobs.append(job)
+        if error_stage is not None:
+            n_errors[error_stage] += 1
 
     #######################################################################
-    all_assemblies = []  # [contigs, tax{}]
-    ribo_cmds = [x[1] for x in riboSeed_jobs if x[1] is not None]
+    # [full contigs, fast contigs, tax{}, accession]; built up as each
+    # riboSeed run is checked, so we never have to go looking for them
+    all_assemblies = []
+    ribo_cmds = [" ".join(x[1]) for x in riboSeed_jobs if x[1] is not None]
     n_assemblies_to_run = sum([1 for x in riboSeed_jobs if x[1] is not None])
     error_during_assembly = False
     if n_assemblies_to_run > 0:
@@ -1345,8 +1956,7 @@ def main():
             logger.info("This can take a while...")
             # the -sync arg makes qsub wait for a return code till
             # the last array job has run.
-            array_res = subprocess.run("qsub -sync y " + script_path,
-                                       shell=sys.platform != "win32",
+            array_res = subprocess.run(["qsub", "-sync", "y", script_path],
                                        check=False)
             if array_res.returncode != 0:
                 error_during_assembly = True
@@ -1356,38 +1966,37 @@ def main():
 
 
         else:
-            logger.info("Processing %i riboSeed runs; this can take a while",
+            logger.info("Finishing %i riboSeed runs; this can take a while",
                         n_assemblies_to_run)
-
-            pool = multiprocessing.Pool(processes=args.njobs)
-            logger.debug("running the following commands:")
-            logger.debug("\n".join(ribo_cmds))
-            riboSeed_pool_results = [
-                pool.apply_async(run_riboSeed_catch_errors,
-                                 (cmd,),
-                                 {"args": args,
-                                  "acc": acc,
-                                  "status_file": sfile,
-                                  "riboSeed_jobs": riboSeed_jobs})
-                for acc, cmd, contigs, sfile, tax_d, _ in riboSeed_jobs]
-            pool.close()
-            pool.join()
-            ribo_results_sum = sum([r.get() for r in riboSeed_pool_results])
+            # with many SRAs, these can be a lot of text to build for nothing
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("running the following commands:")
+                logger.debug("\n".join(ribo_cmds))
+            riboSeed_pool.shutdown(wait=True)
+            ribo_results_sum = sum(
+                [r.result() for r in riboSeed_pool_results])
             logger.debug("Sum of return codes (should be 0): %i", ribo_results_sum)
             if ribo_results_sum != 0:
                 error_during_assembly = True
     else:
         logger.info("No assemblies need to be run")
+    if riboSeed_pool is not None:
+        # no-op if this was already done above
+        riboSeed_pool.shutdown(wait=True)
+    if log_manager is not None:
+        # the riboSeed runs are done with the slots
+        log_manager.shutdown()
     for v in riboSeed_jobs:
         riboSeed_dir = os.path.join(args.output_dir, v[0],
                                     "results", "riboSeed")
         try:
             contigs = check_riboSeed_outcome(
                 ribodir=riboSeed_dir,
-                status_file=status_file)
+                status_file=v[3])
             update_status_file(v[3], message="RIBOSEED COMPLETE")
             write_pass_fail(args, status="PASS", stage=v[0], note="")
-            all_assemblies.append([contigs["full"], contigs["fast"], v[4]])
+            all_assemblies.append(
+                [contigs["full"], contigs["fast"], v[4], v[0]])
         except riboSeedError as e:
             #  assert v[4] == 1, "unknown error running riboSeed found by focusDB"
             write_pass_fail(args, status="ERROR",
@@ -1424,74 +2033,78 @@ def main():
     #  > Min. 1st Qu.  Median    Mean 3rd Qu.    Max.
     #   900    1358    1403    1428    1484    4000
     min_length = 1358  # minimum length seqeunce to extract
-    barrnap_cmds = []
-    for full_assembly, fast_assembly, tax_d in all_assemblies:
-        sra = str(Path(fast_assembly).parents[4].name)
+    barrnap_jobs = []  # [sra, assembly, gff]
+    for full_assembly, fast_assembly, tax_d, sra in all_assemblies:
         full_barr_gff = os.path.join(args.output_dir, sra, "barrnap_full.gff")
         fast_barr_gff = os.path.join(args.output_dir, sra, "barrnap_fast.gff")
         if full_assembly is not None:
-            barrnap_cmds.append("barrnap {} > {}".format(full_assembly, full_barr_gff))
-        barrnap_cmds.append("barrnap {} > {}".format(fast_assembly, fast_barr_gff))
+            barrnap_jobs.append([sra, full_assembly, full_barr_gff])
+        barrnap_jobs.append([sra, fast_assembly, fast_barr_gff])
     #  run with multiprocessing if not SGE, otherwise, deal with single-threads
     #  this is to prevent issues running from head node on a cluster
-    logger.info("Running %i barnap cmds", len(barrnap_cmds))
+    logger.info("Running %i barnap cmds", len(barrnap_jobs))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("running barrnap on the following assemblies:")
+        logger.debug("\n".join([x[1] for x in barrnap_jobs]))
     if args.sge:
-        for cmd in barrnap_cmds:
-            logger.debug(cmd)
-            try:
-                subprocess.run(cmd,
-                               shell=sys.platform !="win32",
-                               stdout=subprocess.PIPE,
-                               stderr=subprocess.PIPE,
-                               check=True)
-            except Exception as e:
-                logger.error(e)
-                write_pass_fail(args, status="ERROR", stage=sra,
-                                note="Error running barrnap")
+        barrnap_results = [run_barrnap_to_gff(assembly, gff, args.cores)
+                           for sra, assembly, gff in barrnap_jobs]
     else:
         pool = multiprocessing.Pool(processes=args.njobs)
-        logger.debug("running the following commands:")
-        logger.debug("\n".join(barrnap_cmds))
-        barrnap_pool_results = [
-            pool.apply_async(
-                subprocess.run,
-                (cmd,),
-                {"shell": sys.platform !="win32",
-                 "stdout":subprocess.PIPE,
-                 "stderr": subprocess.PIPE,
-                 "check": True}
-            ) for  cmd in barrnap_cmds]
+        barrnap_results = pool.starmap(
+            run_barrnap_to_gff,
+            [(assembly, gff, args.cores)
+             for sra, assembly, gff in barrnap_jobs])
         pool.close()
         pool.join()
-        barrnap_results_sum = sum([r.get().returncode for r in barrnap_pool_results])
-        logger.debug("Sum of return codes (should be 0): %i", barrnap_results_sum)
-        if barrnap_results_sum != 0:
-            logger.warning("Error with one or more barrnap runs which is " +
-                           "not refected in summary due to multiprocessing")
-
-    for full_assembly, fast_assembly, tax_d in all_assemblies:
-        # TODO something more elegant than these three lines again. Namespaces?
-        sra = str(Path(fast_assembly).parents[4].name)
+    for (sra, assembly, gff), returncode in zip(barrnap_jobs,
+                                                barrnap_results):
+        if returncode != 0:
+            logger.error("Error running barrnap on %s", assembly)
+            write_pass_fail(args, status="ERROR", stage=sra,
+                            note="Error running barrnap")
+
+    # each assembly gets extracted into its own files (in parallel if not
+    # SGE); these are concatenated in the original order afterwards
+    extract_jobs = []  # [sra, combined output, args for extract_16s_to_parts]
+    for full_assembly, fast_assembly, tax_d, sra in all_assemblies:
+        # TODO something more elegant than these two lines again. Namespaces?
         full_barr_gff = os.path.join(args.output_dir, sra, "barrnap_full.gff")
         fast_barr_gff = os.path.join(args.output_dir, sra, "barrnap_fast.gff")
-
-        try:
-            if full_assembly is not None:
-                this_extracted_seqs = extract_16s_from_assembly(
-                    full_assembly, full_barr_gff, sra,
-                    extract16soutput_full, out_summary, args,
-                    singleline, tax_d, min_length, logger)
-                n_extracted_seqs_full = n_extracted_seqs_full + this_extracted_seqs
-            this_extracted_seqs = extract_16s_from_assembly(
-                fast_assembly, fast_barr_gff, sra,
-                extract16soutput_fast, out_summary, args,
-                singleline, tax_d, min_length, logger)
-            n_extracted_seqs_fast = n_extracted_seqs_fast + this_extracted_seqs
-        except extracting16sError as e:
-            logger.error(e)
+        if full_assembly is not None:
+            extract_jobs.append([
+                sra, extract16soutput_full,
+                (full_assembly, full_barr_gff, sra,
+                 os.path.join(args.output_dir, sra, "full"), args,
+                 singleline, tax_d, min_length, logger.name)])
+        extract_jobs.append([
+            sra, extract16soutput_fast,
+            (fast_assembly, fast_barr_gff, sra,
+             os.path.join(args.output_dir, sra, "fast"), args,
+             singleline, tax_d, min_length, logger.name)])
+    if args.sge:
+        extract_results = [extract_16s_to_parts(*x[2]) for x in extract_jobs]
+    else:
+        pool = multiprocessing.Pool(processes=args.njobs)
+        extract_results = pool.starmap(extract_16s_to_parts,
+                                       [x[2] for x in extract_jobs])
+        pool.close()
+        pool.join()
+    for (sra, outf, _), (this_extracted_seqs, fasta, summary, err) in zip(
+            extract_jobs, extract_results):
+        append_and_remove(fasta, outf)
+        append_and_remove(summary, out_summary)
+        if this_extracted_seqs is None:
+            logger.error(err)
             write_pass_fail(args, status="ERROR", stage=sra,
                             note="unknown error extracting 16S")
+        elif outf == extract16soutput_full:
+            n_extracted_seqs_full = n_extracted_seqs_full + this_extracted_seqs
+        else:
+            n_extracted_seqs_fast = n_extracted_seqs_fast + this_extracted_seqs
 
+    # dont leave any old results half deleted
+    wait_for_discards()
     ###########################################################################
     if error_during_assembly:
         logger.warning("Warning: 1 or more errors occured during assembly")
@@ -1499,15 +2112,18 @@ def main():
                 n_extracted_seqs_full)
     logger.info("Wrote out %i sequences from fast riboSeed run",
                 n_extracted_seqs_fast)
+    # failures for individual accessions are collected as we go (and are in
+    # the SUMMARY file), so a few bad SRAs dont stop the rest of the run
+    logger.info("Assembled %i of %i accessions", len(all_assemblies), nsras)
     if len(n_errors) != 0:
         logger.warning("Errors during run:")
         for k, v in n_errors.items():
-            logger.warning("   " + k + " errors: " + str(v))
+            logger.warning("   %s errors: %s", k, v)
     if n_extracted_seqs_fast == 0:
         write_pass_fail(args, status="FAIL", stage="global",
                         note="No 16s sequences detected in re-assemblies")
         logger.warning("No 16s sequences recovered. exiting")
-        sys.exit()
+        sys.exit(1)
     write_pass_fail(args, status="PASS", stage="global", note="")
     sys.exit()
 
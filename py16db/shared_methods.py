@@ -1,16 +1,45 @@
 import random
+import fnmatch
 import os
 import sys
 import subprocess
-from Bio import SeqIO
+from Bio.SeqIO.FastaIO import SimpleFastaParser
 import gzip
+import io
+import json
+import threading
+
+
+class barrnapError(Exception):
+    pass
+
+
+# extracted 16S sequences get written as RNA, so these go straight from the
+# assembly's DNA to the (reverse complemented) transcript in one
+# str.translate, without building Seq objects; same output as
+# Seq.reverse_complement().transcribe(), ambiguity codes included
+TRANSCRIBE_TABLE = str.maketrans("Tt", "Uu")
+RC_TRANSCRIBE_TABLE = str.maketrans(
+    "ACGTMRWSYKVHDBNXacgtmrwsykvhdbnx",
+    "UGCAKYWSRMBDHVNXugcakywsrmbdhvnx")
 
 
 def filter_sraFind(sraFind, organism_name, strains, get_all, thisseed,
-               use_available, logger):
-    results = get_lines_from_sraFind(sraFind, organism_name)
-    random.seed(thisseed)
-    random.shuffle(results)
+               use_available, logger, cache=None):
+    if cache is None:
+        results = get_lines_from_sraFind(sraFind, organism_name)
+    else:
+        results = cached_lines_from_sraFind(sraFind, organism_name, cache,
+                                            logger)
+    # use our own generator so we dont touch the global random state
+    rng = random.Random(thisseed)
+    if not use_available and strains != 0 and strains < len(results):
+        # only draw as many as we need
+        results = rng.sample(results, strains)
+    else:
+        # with use_available, we need them all in order to pick out the
+        # local ones first
+        rng.shuffle(results)
     # log  a sane amount
     if len(results) < 20:
         logger.debug('All matching SRAs from sraFind: %s', results)
@@ -35,10 +64,8 @@ def filter_sraFind(sraFind, organism_name, strains, get_all, thisseed,
             possible_sras = possible_sras[0: strains]
         logger.debug(possible_sras)
     else:
-        if strains != 0:
-            possible_sras = results[0:strains]
-        else:
-            possible_sras = results
+        # already sampled down to (at most) strains above
+        possible_sras = results
     logger.debug('Selected the following SRAs: %s', possible_sras)
 
     sras = []
@@ -56,73 +83,247 @@ def filter_sraFind(sraFind, organism_name, strains, get_all, thisseed,
 def get_lines_from_sraFind(sraFind, organism_name):
     """sraFind [github.com/nickp60/srafind], contains"""
     results = []
-    with open(sraFind, "r") as infile:
-        for i, line in enumerate(infile):
-            if i == 0:
-                header = line.strip().replace('"', '').replace("'", "").split("\t")
-                org_col = header.index("organism_ScientificName")
-                plat_col  = header.index("platform")
-                run_SRAs = header.index("run_SRAs")
-            split_line = [x.replace('"', '').replace("'", "") for x
-                          in line.strip().split("\t")]
-            if split_line[org_col].startswith(organism_name):
-                if split_line[plat_col].startswith("ILLUMINA"):
-                    results.append(split_line[run_SRAs])
+    quotes = b"\"'"
+    org_b = organism_name.encode()
+    with open(sraFind, "rb") as infile:
+        header = infile.readline().decode().strip().replace(
+            '"', '').replace("'", "").split("\t")
+        org_col = header.index("organism_ScientificName")
+        plat_col = header.index("platform")
+        run_SRAs = header.index("run_SRAs")
+        last_col = max(org_col, plat_col, run_SRAs)
+        # work with bytes: most lines wont match, so we only
+        # bother decoding the ones that do
+        for line in infile:
+            # if the name isnt anywhere in the line, it cant be in the
+            # organism column; this check is much cheaper than splitting
+            if org_b not in line:
+                continue
+            # we never look past last_col, so dont split the rest
+            split_line = line.rstrip(b"\n").split(b"\t", last_col + 1)
+            # skip truncated/malformed rows rather than dying on them
+            if len(split_line) <= last_col:
+                continue
+            # only strip the quotes from the columns we need, and
+            # bail out as early as possible
+            if not split_line[org_col].strip(quotes).startswith(org_b):
+                continue
+            if split_line[plat_col].strip(quotes).startswith(b"ILLUMINA"):
+                results.append(split_line[run_SRAs].strip(quotes).decode())
     results = [x for x in results if x != ""]
     return results
 
 
+def cached_lines_from_sraFind(sraFind, organism_name, cache, logger):
+    """ get_lines_from_sraFind, but remembering the results for each organism
+    in the json file cache.  The cache is thrown out whenever the sraFind
+    file changes (by size or mtime)
+    """
+    key = "{}\t{}".format(os.path.getmtime(sraFind),
+                          os.path.getsize(sraFind))
+    data = {}
+    if os.path.exists(cache):
+        try:
+            with open(cache, "r") as inf:
+                data = json.load(inf)
+        except ValueError:
+            logger.warning("ignoring malformed sraFind cache %s", cache)
+    if data.get("sraFind") != key:
+        data = {"sraFind": key, "organisms": {}}
+    if organism_name in data["organisms"]:
+        logger.debug("using cached sraFind results for %s", organism_name)
+        return list(data["organisms"][organism_name])
+    results = get_lines_from_sraFind(sraFind, organism_name)
+    data["organisms"][organism_name] = results
+    write_atomically(cache, json.dumps(data))
+    return list(results)
+
+
+def get_lines_from_proks(path, org):
+    """ same as plentyofbugs' get_lines_of_interest_from_proks
+
+    NCBI's prokaryotes.txt is big, and only a few lines will be for our
+    organism: the organism name is the first column, so we can check the
+    raw bytes before bothering to decode and split anything.
+    """
+    assert org is not None, "organism name must be provided"
+    org_lines = []
+    org_b = org.encode()
+    with open(path, "rb") as proks:
+        for line in proks:
+            if not line.lstrip().startswith(org_b):
+                continue
+            splitline = line.decode().strip().split("\t")
+            # column 9 has the nucc accession if it is a complete genome
+            if len(splitline) > 8 and splitline[8].startswith("chrom"):
+                org_lines.append(splitline)
+    if len(org_lines) == 0:
+        sys.stderr.write("no " + org +
+                         " matches in the prokaryotes.txt file\n")
+    return org_lines
+
+
+def iter_files_matching(directory, pattern):
+    """ like glob.iglob(os.path.join(directory, pattern)), but only for files
+
+    os.scandir gives us the file type from the directory listing, so unlike
+    glob we dont need to stat each entry; that adds up on network
+    filesystems with big genome directories.  Being lazy, checking for any
+    match stops at the first one
+    """
+    try:
+        entries = os.scandir(directory)
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if not entry.name.startswith(".") and \
+           fnmatch.fnmatch(entry.name, pattern) and \
+           entry.is_file():
+            yield entry.path
+
+
+def files_matching(directory, pattern):
+    """ list of iter_files_matching, like glob.glob for files
+    """
+    return list(iter_files_matching(directory, pattern))
+
+
+GZ_EXTS = (".gz", ".gzip")
+FASTQ_BUFSIZE = 1 << 20
+
+
+def open_fastq(path, mode="rb"):
+    """ open a fastq file, which may or may not be gzipped
+
+    Binary handles get a 1MiB buffer; with the default 8KiB one, we spend
+    more time going back and forth to zlib/the disk than reading.
+    """
+    if path.endswith(GZ_EXTS):
+        if "b" in mode:
+            return io.BufferedReader(gzip.open(path, mode),
+                                     buffer_size=FASTQ_BUFSIZE)
+        return gzip.open(path, mode)
+    if "b" in mode:
+        return open(path, mode, buffering=FASTQ_BUFSIZE)
+    return open(path, mode)
+
+
+def fastq_seq_lengths(buf, pos, nreads):
+    """ yield (seq_length, next_record_pos) for the complete records in buf
+
+    Searching for newlines (which bytes.find does with memchr) is the only
+    real work here, and we only need to do it for 3 of the 4 lines: the
+    quality line is the same length as the sequence, so we can skip straight
+    over it.  If it isnt where we expect, we fall back to searching for it.
+    """
+    for i in range(nreads):
+        head_end = buf.find(b"\n", pos)
+        seq_end = buf.find(b"\n", head_end + 1)
+        plus_end = buf.find(b"\n", seq_end + 1)
+        if head_end < 0 or seq_end < 0 or plus_end < 0:
+            return
+        seq_len = seq_end - head_end - 1
+        qual_end = plus_end + 1 + seq_len
+        if buf[qual_end: qual_end + 1] != b"\n":
+            qual_end = buf.find(b"\n", plus_end + 1)
+            if qual_end < 0:
+                return
+        if buf[seq_end - 1: seq_end] == b"\r":
+            seq_len -= 1
+        pos = qual_end + 1
+        yield seq_len, pos
+
+
 def get_ave_read_len_from_fastq(fastq1, logger=None):
     """return average read length in fastq1 file from first N reads
+
+    fastq records are strictly 4 lines, so rather than building SeqRecords
+    we just measure the sequence lines in big binary blocks
     """
-    nreads = None
     nreads = 1000
     tot = 0
-    if os.path.splitext(fastq1)[-1] in ['.gz', '.gzip']:
-        open_fun = gzip.open
-    else:
-        open_fun = open
+    count = 0
+    pos = 0
+    buf = b""
     logger.debug("Obtaining average read length")
-    with open_fun(fastq1, "rt") as file_handle:
-        data = SeqIO.parse(file_handle, "fastq")
-        for i, read in enumerate(data):
-            tot += len(read)
-            if nreads is not None:
-                if i  >= nreads:
-                    break
-    return float(tot / i)
+    with open_fastq(fastq1) as file_handle:
+        while count < nreads:
+            block = file_handle.read(FASTQ_BUFSIZE)
+            # with what is left of the last block, this can complete a
+            # record that was split between them
+            buf = buf[pos:] + block
+            pos = 0
+            if not block and not buf.endswith(b"\n"):
+                # so we dont miss the last read of a file without a newline
+                buf += b"\n"
+            for seq_len, pos in fastq_seq_lengths(buf, pos, nreads - count):
+                tot += seq_len
+                count += 1
+            if not block:
+                break
+    if count == 0:
+        raise ValueError("No reads found in %s" % fastq1)
+    return float(tot / count)
+
+
+def write_atomically(path, text):
+    """ replace the contents of path with text
+
+    This writes to a temp file first and swaps it in, which is atomic, so
+    concurrent runs never see half a file, and a crash leaves either the
+    old or the new one.  The temp file is named for the process and thread,
+    as threads of the same run can be writing the same path
+    """
+    tmp = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+    with open(tmp, "w") as outf:
+        outf.write(text)
+    os.replace(tmp, path)
+
+
+def run_and_log(cmd, logfile, **kwargs):
+    """ run cmd, writing its stdout and stderr to logfile
+
+    Capturing output with subprocess.PIPE holds all of it in memory, which
+    for chatty tools can be huge. This keeps it on disk for debugging instead
+    """
+    with open(logfile, "w") as log:
+        return subprocess.run(cmd,
+                              stdout=log,
+                              stderr=subprocess.STDOUT,
+                              check=True,
+                              **kwargs)
 
 
 def run_barrnap(assembly,  results, logger):
-    barrnap = "barrnap {assembly} > {results}".format(**locals())
-    logger.debug('Identifying 16S sequences with barnap: %s', barrnap)
+    # barrnap writes the gff to stdout; hand it the results file directly
+    # rather than going through a shell just for the redirect
+    barrnap = ["barrnap", assembly]
+    logger.debug('Identifying 16S sequences with barnap: %s > %s',
+                 " ".join(barrnap), results)
     try:
-        subprocess.run(barrnap,
-                       shell=sys.platform != "win32",
-                       stdout=subprocess.PIPE,
-                       stderr=subprocess.PIPE,
-                       check=True)
+        with open(results, "wb") as out:
+            subprocess.run(barrnap,
+                           stdout=out,
+                           stderr=subprocess.DEVNULL,
+                           check=True)
     except Exception as e:
         logger.error(e)
         raise barrnapError(
-            "Error running the following command %s" % barrnap)
+            "Error running the following command %s > %s" % (
+                " ".join(barrnap), results))
 
 
 def extract_16s_from_assembly(assembly, gff, sra, output, output_summary,
                               args, singleline, tax_d, min_length, logger):
     logger.debug("processing %s", assembly)
-    tax_string = tax_d["S"][2]
     # if no label at some level, give the next one
-    if len(tax_string.replace(" ", "")) == 0:  # if genus only
-        tax_string = tax_d["G"][2] + "sp."
-        if len(tax_string.replace(" ", "").replace(".sp", "")) == 0:
-            tax_string = tax_d["F"][2]
-            if len(tax_string.replace(" ", "")) == 0:
-                tax_string = tax_d["O"][2]
-                if len(tax_string.replace(" ", "")) == 0:
-                    tax_string = tax_d["C"][2]
-                    if len(tax_string.replace(" ", "")) == 0:
-                        tax_string = tax_d["P"][2]
+    tax_string = tax_d["P"][2]
+    for lev in ["S", "G", "F", "O", "C"]:
+        if tax_d[lev][2].strip():
+            tax_string = tax_d[lev][2]
+            if lev == "G":  # if genus only
+                tax_string = tax_string + "sp."
+            break
     score_string = str(tax_d["D"][0])
     taxid_string = tax_d["D"][1]
     big_tax_string = tax_d["D"][2]
@@ -131,87 +332,78 @@ def extract_16s_from_assembly(assembly, gff, sra, output, output_summary,
         taxid_string = taxid_string + ";" + tax_d[lev][1]
         big_tax_string = big_tax_string + ";" + tax_d[lev][2]
 
+    # the taxonomy is the same for every hit, so only build it once;
+    # these are joined on rather than formatted, in case of stray braces
+    header_tail = " " + big_tax_string + "\n"
+    summary_tail = "\t".join(
+        [big_tax_string, score_string, taxid_string, tax_string]) + "\n"
+
     # struction of results16s:
     # [sra_#, chromosome, start, end, reverse complimented,
     #  big_tax_string, score_string, taxid_string, tax_string]
     results16s = {}
     nseqs = 0
-
-    with open(gff, "r") as rrn, open(output, "a") as outf, \
-         open(output_summary, "a") as outsum:
-        rrn_num = 0
-        for rawline in rrn:
-            line = rawline.strip().split('\t')
-            # need this: catches index errors from the comment lines
-            if line[0].startswith("##"):
-                pass
-            elif line[8].startswith("Name=16S"):
-                rrn_num = rrn_num + 1
-                if line[6] == "-":
-                    suffix = 'chromosome-RC@'
-                else:
-                    suffix = ''
-                chrom = line[0]
-                ori = line[6]
-                start = int(line[3])
-                end = int(line[4])
-                if (end - start) < min_length:
-                    logger.info("ignoring short rRNA:")
-                    logger.info(line)
-                    continue
-                thisid = "{}_{}".format(sra, rrn_num)
-                results16s[thisid] = [chrom, start, end, line[6]]
-                with open(assembly, "r") as asmb:
-                    for rec in SeqIO.parse(asmb, "fasta"):
-                        #logger.debug("%s\t%s", chrom, rec.id)
-                        if rec.id != chrom:
-                            continue
-                        seq = rec.seq[start + 1: end + 1]
-                        if ori == "-":
-                            seq = seq.reverse_complement()
-                        thisidcoords = "{thisid}.{start}.{end}".format(
-                            **locals())
-                        # Need to disable linewrapping for use with SILVA, etc
-                        if singleline:
-                            seqstr = str(seq.transcribe())
-                            outf.write(
-                                str(">{thisidcoords} {big_tax_string}\n" +
-                                    "{seqstr}\n").format(**locals()))
-                        else:
-                            SeqIO.write(
-                                SeqRecord(
-                                    seq.transcribe(), id=thisidcoords,
-                                    description=big_tax_string),
-                                outf,  "fasta")
-                        outsum.write(
-                            str(
-                                "{thisid}\t{assembly}\t" +
-                                "{chrom}\t{start}\t{end}\t{big_tax_string}\t" +
-                                "{score_string}\t{taxid_string}\t" +
-                                "{tax_string}\n"
-                            ).format(**locals()))
-                        nseqs = nseqs + 1
+    # read the gff in one go, keeping just the 16S records; barrnap puts
+    # Name first in the attributes, so this never matches ## comment lines
+    with open(gff, "r") as rrn:
+        hits = [x.split('\t') for x in rrn.read().splitlines()
+                if "\tName=16S" in x]
+    # read the assembly once rather than rescanning it for each rDNA, only
+    # holding onto the contigs with hits, as plain strings
+    hit_chroms = set([x[0] for x in hits])
+    recs = {}
+    if hit_chroms:
+        with open(assembly, "r") as inf:
+            for title, seq in SimpleFastaParser(inf):
+                chrom = title.split(None, 1)[0]
+                if chrom in hit_chroms:
+                    recs[chrom] = seq
+                    if len(recs) == len(hit_chroms):
+                        break
+    with open(output, "a") as outf, open(output_summary, "a") as outsum:
+        for rrn_num, line in enumerate(hits, 1):
+            chrom = line[0]
+            ori = line[6]
+            start = int(line[3])
+            end = int(line[4])
+            if (end - start) < min_length:
+                logger.info("ignoring short rRNA:")
+                logger.info(line)
+                continue
+            thisid = "{}_{}".format(sra, rrn_num)
+            results16s[thisid] = [chrom, start, end, line[6]]
+            if chrom not in recs:
+                continue
+            # gff coordinates are 1-based and inclusive
+            seqstr = recs[chrom][start - 1: end]
+            if ori == "-":
+                seqstr = seqstr[::-1].translate(RC_TRANSCRIBE_TABLE)
+            else:
+                seqstr = seqstr.translate(TRANSCRIBE_TABLE)
+            thisidcoords = "{}.{}.{}".format(thisid, start, end)
+            # Need to disable linewrapping for use with SILVA, etc;
+            # otherwise wrap at 60, same as SeqIO.write would
+            if not singleline:
+                seqstr = "\n".join(
+                    [seqstr[i: i + 60]
+                     for i in range(0, len(seqstr), 60)])
+            outf.write(">" + thisidcoords + header_tail + seqstr + "\n")
+            outsum.write("{}\t{}\t{}\t{}\t{}\t".format(
+                thisid, assembly, chrom, start, end) + summary_tail)
+            nseqs = nseqs + 1
     return nseqs
 
 
 def run_kraken2(args, contigs, dest_prefix, db, logger):
     out = dest_prefix + ".output"
     report = dest_prefix + ".report"
+    cmd = ["kraken2", "--db", db, "--threads", str(args.cores),
+           "--use-names", "--output", out, "--report", report, contigs]
     if args.memory < 20 or args.kraken_mem_mapping:
-        memstring = "--memory-mapping "
-    else:
-        memstring = ""
-    cmd = str(
-        "kraken2 {memstring}--db {db} --threads {args.cores} " +
-        "--use-names --output {out} " +
-        "--report {report} {contigs}").format(**locals())
+        cmd.insert(1, "--memory-mapping")
     if not os.path.exists(report):
-        logger.debug(cmd)
-        subprocess.run(cmd,
-                       shell=sys.platform != "win32",
-                       stdout=subprocess.PIPE,
-                       stderr=subprocess.PIPE,
-                       check=True)
+        logger.debug(" ".join(cmd))
+        run_and_log(cmd, dest_prefix + ".log")
     return report
 
 
@@ -237,9 +429,9 @@ def parse_kraken_report(kraken2_report):
                 raise ValueError(
                     "Malformed kraken2 report; should be 6 columns: %s" % line)
             perc, n_in, n_at, lev, taxid, label = sline
-            if lev in tax.keys():
+            if lev in tax:
                 # only report the top hit
-                this = float(perc.strip()), taxid, label.strip()
-                if tax[lev][0] < this[0]:
-                    tax[lev] = float(perc.strip()), taxid, label.strip()
+                this_perc = float(perc)
+                if tax[lev][0] < this_perc:
+                    tax[lev] = this_perc, taxid, label.strip()
     return tax
@@ -2,6 +2,7 @@ import os
 import shutil
 from pathlib import Path
 import logging as logger
+import urllib.error
 from .FocusDBData import FocusDBData
 here = os.path.dirname(__file__)
 thisdbdir = os.path.join(here, ".test_db_dir", "")
@@ -36,3 +37,61 @@ def test_add_SRAs():
     assert fDB.SRAs['SRRtest123']['status'] == "mostly_ok", \
         "error adding SRA to list"
     assert fDB.SRAs['SRRtest123']['readlen'] == 123, "error adding read len"
+
+
+def test_fetch_fastqs_from_ena_errors():
+    fDB = FocusDBData(dbdir = thisdbdir,
+                      refdir = thisrefdir,
+                      prokaryotes="proks",
+                      sraFind_data="sraFind.txt")
+    dest = os.path.join(thisdbdir, "SRRtest123")
+    os.makedirs(dest, exist_ok=True)
+    no_ena = os.path.join(dest, ".no_ena")
+
+    def fail_with(code):
+        def get_urls(SRA, timeout):
+            raise urllib.error.HTTPError("url", code, "msg", None, None)
+        return get_urls
+    # a busy or broken ENA could work next time, so dont remember it
+    for code in [429, 500, 503]:
+        fDB.get_ena_fastq_urls = fail_with(code)
+        assert not fDB.fetch_fastqs_from_ena("SRRtest123", dest, 1, logger)
+        assert not os.path.exists(no_ena)
+    fDB.get_ena_fastq_urls = fail_with(404)
+    assert not fDB.fetch_fastqs_from_ena("SRRtest123", dest, 1, logger)
+    assert os.path.exists(no_ena)
+
+
+def test_stage_kraken2_db():
+    krakendir = os.path.join(thisdbdir, "kraken", "")
+    shm = os.path.join(thisdbdir, "shm")
+    os.makedirs(krakendir, exist_ok=True)
+    os.makedirs(shm, exist_ok=True)
+    fDB = FocusDBData(dbdir = thisdbdir,
+                      refdir = thisrefdir,
+                      prokaryotes="proks",
+                      sraFind_data="sraFind.txt",
+                      krakendir=krakendir)
+    # nothing to stage, so keep using the db where it is
+    assert not fDB.stage_kraken2_db(logger, shm=shm)
+    assert fDB.krakendir == krakendir
+    with open(os.path.join(krakendir, "hash.k2d"), "w") as outf:
+        outf.write("kmers")
+    assert fDB.stage_kraken2_db(logger, shm=shm)
+    staged = os.path.join(fDB.krakendir, "hash.k2d")
+    assert os.path.exists(staged)
+    assert fDB.krakendir.startswith(shm)
+    # a rebuilt db of the same size still gets copied again
+    with open(os.path.join(krakendir, "hash.k2d"), "w") as outf:
+        outf.write("kmerz")
+    os.utime(os.path.join(krakendir, "hash.k2d"), (1, 1))
+    fDB.krakendir = krakendir
+    assert fDB.stage_kraken2_db(logger, shm=shm)
+    with open(staged, "r") as inf:
+        assert inf.read() == "kmerz"
+    assert [x for x in os.listdir(fDB.krakendir) if x.endswith(".tmp")] == []
+
+
+def teardown_module():
+    if os.path.exists(thisdbdir):
+        shutil.rmtree(thisdbdir)
@@ -18,7 +18,7 @@ class alignmentTest(unittest.TestCase):
       test_output = (self.test_dir)
       test_fasta = (self.fasta)
       outpath, test_result = alignment(multifasta=test_fasta, pre=test_output)
-      assert test_result.startswith("mafft --retree 2 --reorder"), "malformatted mafft cmd"
+      assert " ".join(test_result).startswith("mafft --retree 2 --reorder"), "malformatted mafft cmd"
       assert outpath == self.test_dir + ".mafft"
 
 
@@ -34,5 +34,5 @@ class alignmentLongTest(unittest.TestCase):
       test_output = (self.test2_dir)
       inputfasta = (self.inputfasta)
       out_path, test_result = alignment(multifasta=inputfasta, pre=test_output)
-      assert test_result.startswith("mafft --retree 2 --reorder"), "malformatted mafft cmd"
+      assert " ".join(test_result).startswith("mafft --retree 2 --reorder"), "malformatted mafft cmd"
       assert out_path == self.test2_dir + ".mafft"
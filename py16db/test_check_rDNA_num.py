@@ -1,5 +1,6 @@
-from .run_focusDB import check_rDNA_copy_number
+from .run_focusDB import check_rDNA_copy_number, cached_rDNA_copy_number
 import os
+import json
 import unittest
 import shutil
 import logging as logger
@@ -24,3 +25,17 @@ class checkrDNATest(unittest.TestCase):
         os.makedirs(out)
         test_result = check_rDNA_copy_number(ref=ref, output=out, logger=logger)
         assert test_result == 7
+
+    def test_cached_rDNA(self):
+        # a cached count means barrnap doesnt get run at all
+        out = (self.test_dir)
+        os.makedirs(out)
+        ref = os.path.join(out, "ref.fna")
+        with open(ref, "w") as outf:
+            outf.write(">contig1\nACGT\n")
+        with open(os.path.join(out, "rDNA_counts.json"), "w") as outf:
+            json.dump({os.path.abspath(ref): [os.path.getmtime(ref),
+                                              os.path.getsize(ref), 3]},
+                      outf)
+        test_result = cached_rDNA_copy_number(ref=ref, output=out, logger=logger)
+        assert test_result == 3
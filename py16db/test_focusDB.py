@@ -1,9 +1,12 @@
 from .run_focusDB import get_coverage, downsample, make_riboseed_cmd, sralist,\
     pob, referenceNotGoodEnoughError, check_riboSeed_outcome, riboSeedError, \
-    riboSeedUnsuccessfulError
+    riboSeedUnsuccessfulError, count_newlines, find_programs, \
+    discard_dir, wait_for_discards, coverageError, run_riboSeed_in_slot
+from . import run_focusDB
 
 import os
 import shutil
+import threading
 import unittest
 import subprocess
 import sys
@@ -143,9 +146,9 @@ class coverageTests(unittest.TestCase):
         target_cmd = "ribo run -r /Users/alexandranolan/Desktop/16db/py16db/test_data/ecoli/NC_011750.1.fna -F /Users/alexandranolan/Desktop/16db/py16db/test_data/test_reads1.fq -R /Users/alexandranolan/Desktop/16db/py16db/test_data/test_reads2.fq --cores 4 --threads 1 -v 1 -o /Users/alexandranolan/Desktop/16db/py16db/riboSeed --serialize --subassembler spades --just_seed --skip_control --stages none --memory 8"
         for part in range(len(target_cmd.split(" "))):
             if part not in [3, 5, 7, 15]:
-                print(test_result.split(" ")[part] )
+                print(test_result[part] )
                 print(target_cmd.split(" ")[part] )
-                assert test_result.split(" ")[part] == target_cmd.split(" ")[part]
+                assert test_result[part] == target_cmd.split(" ")[part]
 
 
 
@@ -207,6 +210,10 @@ class parseRiboSeedTest(unittest.TestCase):
         Path(os.path.join(self.test_dir, "full_fail", "seed",  "final_long_reads", "riboSeedContigs.fasta")).touch()
         # dont write final contigs for fail
 
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
     def test_check_riboSeed_outcome_baderror(self):
         with self.assertRaises(riboSeedError):
             contigs = check_riboSeed_outcome(
@@ -239,3 +246,143 @@ class parseRiboSeedTest(unittest.TestCase):
             status_file=self.status_file)
         self.assertEquals(contigs["full"], None)
         self.assertTrue(contigs["fast"] is not None)
+
+
+class countNewlinesTest(unittest.TestCase):
+    def test_count_newlines_unterminated(self):
+        # the last read of a file without a trailing newline still counts
+        reads = os.path.join(os.path.dirname(__file__), "unterminated.fq")
+        with open(reads, "w") as outf:
+            outf.write("@r1\nACGT\n+\nIIII\n@r2\nACGT\n+\nIIII")
+        try:
+            assert count_newlines(reads) == 8
+        finally:
+            os.remove(reads)
+
+
+class findProgramsTest(unittest.TestCase):
+    def test_find_programs(self):
+        test_result = find_programs(["sh", "not_a_real_program"])
+        assert test_result == {"sh": shutil.which("sh")}
+
+
+class discardDirTest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.join(os.path.dirname(__file__),
+                                     "discard_dir_test")
+        os.makedirs(os.path.join(self.test_dir, "results", "sub"))
+
+    def tearDown(self):
+        # the background rm might still be going
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_discard_dir(self):
+        results = os.path.join(self.test_dir, "results", "")
+        discard_dir(results)
+        # gone straight away, even if the deleting takes a while
+        assert not os.path.exists(results)
+        wait_for_discards()
+        assert os.listdir(self.test_dir) == []
+
+    def test_discard_dir_stale(self):
+        # an earlier run's leftovers get cleaned up with the next discard
+        stale = os.path.join(self.test_dir, "results.old_abc123")
+        os.makedirs(os.path.join(stale, "results"))
+        discard_dir(os.path.join(self.test_dir, "results"))
+        wait_for_discards()
+        assert os.listdir(self.test_dir) == []
+
+
+class trimmedCoverageTest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.join(os.path.dirname(__file__),
+                                     "trimmed_coverage_test")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.reads1 = os.path.join(self.test_dir, "reads_1.fq")
+        self.reads2 = os.path.join(self.test_dir, "reads_2.fq")
+        # mates trimmed to different lengths, both well short of the 150
+        # they were downloaded at
+        with open(self.reads1, "w") as outf:
+            for i in range(4):
+                outf.write("@r%i\n%s\n+\n%s\n" % (i, "A" * 10, "I" * 10))
+        with open(self.reads2, "w") as outf:
+            for i in range(4):
+                outf.write("@r%i\n%s\n+\n%s\n" % (i, "C" * 6, "I" * 6))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_coverage_trimmed_mates(self):
+        test_result = get_coverage(read_length=150, approx_length=8,
+                                   fastq1=self.reads1, fastq2=self.reads2,
+                                   logger=logger)
+        # 4 pairs of 10 + 6 bases over 8bp
+        assert test_result == 8.0
+        test_result = get_coverage(read_length=150, approx_length=8,
+                                   fastq1=self.reads1, fastq2=None,
+                                   logger=logger)
+        assert test_result == 5.0
+
+
+class riboSeedSlotTest(unittest.TestCase):
+    def setUp(self):
+        self.slot_poll = run_focusDB.SLOT_POLL
+        run_focusDB.SLOT_POLL = .01
+
+    def tearDown(self):
+        run_focusDB.SLOT_POLL = self.slot_poll
+
+    def test_run_riboSeed_in_slot_aborted(self):
+        # the only slot went with a dead worker, so dont wait for it
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        aborted = threading.Event()
+        aborted.set()
+        assert run_riboSeed_in_slot(slots, aborted, ["riboSeed"],
+                                    acc="SRR1") == 1
+        # nothing to run needs no slot
+        assert run_riboSeed_in_slot(slots, aborted, None, acc="SRR1") == 0
+
+
+class lowCoverageTest(unittest.TestCase):
+    def setUp(self):
+        self.reads = os.path.join(os.path.dirname(__file__), "test_data",
+                                  "test_reads1.fq")
+        self.downsample_dir = os.path.join(os.path.dirname(__file__),
+                                           "low_coverage_test", "downsampled")
+
+    def test_downsample_low_coverage(self):
+        # these are ~1x, which the file sizes alone can rule out
+        with self.assertRaises(coverageError):
+            downsample(
+                read_length=150,
+                approx_length=5132068,
+                fastq1=self.reads,
+                fastq2=self.reads,
+                destination=self.downsample_dir,
+                mincoverage=5,
+                maxcoverage=10,
+                run=True,
+                logger=logger)
+        assert not os.path.exists(self.downsample_dir)
+
+    def test_downsample_low_coverage_no_counting(self):
+        # the file sizes settle it, so the reads never get counted
+        def no_counting(*args, **kwargs):
+            raise AssertionError("reads were counted")
+        get_coverage = run_focusDB.get_coverage
+        run_focusDB.get_coverage = no_counting
+        try:
+            with self.assertRaises(coverageError):
+                downsample(
+                    read_length=150,
+                    approx_length=5132068,
+                    fastq1=self.reads,
+                    fastq2=self.reads,
+                    destination=self.downsample_dir,
+                    mincoverage=5,
+                    maxcoverage=10,
+                    run=True,
+                    logger=logger)
+        finally:
+            run_focusDB.get_coverage = get_coverage
@@ -64,3 +64,8 @@ def test_fastq_files():
                 assert rev == os.path.join(base, "test_2.fastq"), "missing rev library"
             if v[3]:
                 assert fwd == os.path.join(base, "test.fastq"), "missing single library"
+
+
+def teardown_module():
+    if os.path.exists(testdir):
+        shutil.rmtree(testdir)
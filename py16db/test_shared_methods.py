@@ -1,9 +1,14 @@
-from .shared_methods import filter_sraFind, get_ave_read_len_from_fastq
+from .shared_methods import filter_sraFind, get_ave_read_len_from_fastq, \
+    extract_16s_from_assembly, parse_kraken_report, files_matching, \
+    iter_files_matching, fastq_seq_lengths, RC_TRANSCRIBE_TABLE, \
+    write_atomically
+from Bio.Seq import Seq
 
 from .run_focusDB import  check_read_len
 import os
 import shutil
 import unittest
+import concurrent.futures
 from nose.tools.nontrivial import with_setup
 import logging as logger
 import math
@@ -23,6 +28,22 @@ class filter_SRATest(unittest.TestCase):
                                  strains=1, get_all=True, logger=logger)
         assert ["DRR021662"] == test_result
 
+    def test_filter_SRA_cached(self):
+        cache = os.path.join(os.path.dirname(__file__), "test_sraFind_cache.json")
+        if os.path.exists(cache):
+            os.remove(cache)
+        for i in range(2):
+            # the second run comes from the cache, and should match
+            test_result = filter_sraFind(sraFind=self.sra_find,
+                                         organism_name="Lactobacillus oryzae",
+                                         thisseed=1,
+                                         use_available=False,
+                                         strains=1, get_all=True,
+                                         logger=logger, cache=cache)
+            assert ["DRR021662"] == test_result
+            assert os.path.exists(cache)
+        os.remove(cache)
+
 
 class download_SRATest(unittest.TestCase):
     ''' test for filter_srapure and download_sra in run_all.py
@@ -78,3 +99,100 @@ class avereadlenTest(unittest.TestCase):
         print(test_result)
         assert 150 == math.floor(test_result)
         assert code == 1
+
+
+class extract16sTest(unittest.TestCase):
+    ''' test for pulling the 16S sequences out of an assembly
+    '''
+    def setUp(self):
+        self.test_dir = os.path.join(os.path.dirname(__file__),
+                                     "test_extract_16s", "")
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        self.assembly = os.path.join(self.test_dir, "contigs.fasta")
+        self.gff = os.path.join(self.test_dir, "barrnap.gff")
+        self.output = os.path.join(self.test_dir, "16s.fasta")
+        self.summary = os.path.join(self.test_dir, "summary.tab")
+        self.tax_d = parse_kraken_report(os.path.join(
+            os.path.dirname(__file__), "test_data", "kraken2.report"))
+        with open(self.assembly, "w") as outf:
+            outf.write(">contig1\nAAAAACCCCCGGGGGTTTTT\n>contig2\nACGTACGTAC\n")
+        with open(self.gff, "w") as outf:
+            outf.write("##gff-version 3\n")
+            outf.write("contig1\tbarrnap:0.9\trRNA\t6\t15\t0\t+\t.\t" +
+                       "Name=16S_rRNA;product=16S ribosomal RNA\n")
+            outf.write("contig2\tbarrnap:0.9\trRNA\t1\t8\t0\t-\t.\t" +
+                       "Name=16S_rRNA;product=16S ribosomal RNA\n")
+
+    def tearDown(self):
+        "tear down test fixtures"
+        shutil.rmtree(self.test_dir)
+
+    def test_extract_16s_from_assembly(self):
+        nseqs = extract_16s_from_assembly(
+            self.assembly, self.gff, "SRR1", self.output, self.summary,
+            args=None, singleline=True, tax_d=self.tax_d, min_length=5,
+            logger=logger)
+        assert nseqs == 2
+        with open(self.output, "r") as inf:
+            seqs = [x.strip() for x in inf if not x.startswith(">")]
+        assert seqs == ["CCCCCGGGGG", "ACGUACGU"]
+
+    def test_rc_transcribe_table(self):
+        # ambiguity codes and soft-masked bases should match Biopython too
+        seq = "ACGTMRWSYKVHDBNXacgtmrwsykvhdbnx"
+        assert seq[::-1].translate(RC_TRANSCRIBE_TABLE) == \
+            str(Seq(seq).reverse_complement().transcribe())
+
+
+class filesMatchingTest(unittest.TestCase):
+    def test_files_matching(self):
+        test_data = os.path.join(os.path.dirname(__file__), "test_data")
+        test_result = files_matching(test_data, "test_reads*.fq")
+        assert sorted([os.path.basename(x) for x in test_result]) == \
+            ["test_reads1.fq", "test_reads2.fq"]
+        # directories dont count, and missing dirs are just empty
+        assert files_matching(test_data, "ecoli") == []
+        assert files_matching(os.path.join(test_data, "nope"), "*") == []
+
+    def test_iter_files_matching(self):
+        test_data = os.path.join(os.path.dirname(__file__), "test_data")
+        first = next(iter_files_matching(test_data, "test_reads*.fq"))
+        assert os.path.basename(first) in ["test_reads1.fq", "test_reads2.fq"]
+        assert next(iter_files_matching(
+            os.path.join(test_data, "nope"), "*"), None) is None
+
+
+class fastqSeqLengthsTest(unittest.TestCase):
+    def test_fastq_seq_lengths(self):
+        buf = b"@r1\nACGT\n+\nIIII\n@r2\r\nAC\r\n+\r\nII\r\n@r3\nACG"
+        # the last record is incomplete, so it shouldnt be reported
+        assert list(fastq_seq_lengths(buf, 0, 10)) == [(4, 16), (2, 32)]
+        assert list(fastq_seq_lengths(buf, 0, 1)) == [(4, 16)]
+
+    def test_fastq_seq_lengths_bad_qual(self):
+        # qualities the wrong length mean searching for the newline after all
+        buf = b"@r1\nACGT\n+\nIII\n@r2\nAC\n+\nII\n"
+        assert list(fastq_seq_lengths(buf, 0, 10)) == [(4, 15), (2, 27)]
+
+
+class writeAtomicallyTest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.join(os.path.dirname(__file__),
+                                     "write_atomically_test")
+        os.makedirs(self.test_dir, exist_ok=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_write_atomically_threads(self):
+        # threads of the same process writing the same file dont trip
+        # over each other's temp files
+        path = os.path.join(self.test_dir, "cache.json")
+        texts = [str(i) * 100000 for i in range(8)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as ex:
+            list(ex.map(write_atomically, [path for x in texts], texts))
+        with open(path, "r") as inf:
+            assert inf.read() in texts
+        assert os.listdir(self.test_dir) == ["cache.json"]
@@ -1,5 +1,6 @@
 import os
-from .run_focusDB import parse_status_file, update_status_file
+from .run_focusDB import parse_status_file, update_status_file, StatusFile, \
+    status_file_has
 here = os.path.dirname(__file__)
 fpath = os.path.join(here, "sample_status_file")
 
@@ -18,3 +19,90 @@ def test_update_status_file():
     statuses = parse_status_file(fpath)
     print(statuses)
     assert statuses.sort() == ["FIRST THING", "THIRD THING"].sort()
+
+
+def test_status_file_cache():
+    jpath = os.path.join(here, "sample_cache_status_file")
+    with open(jpath, "w") as f:
+        f.write("FIRST THING")
+    status = StatusFile(jpath)
+    status.update(message="CACHED THING")
+    assert "CACHED THING" in status
+    status.update(to_remove=["CACHED THING"])
+    assert "CACHED THING" not in status
+    statuses = parse_status_file(jpath)
+    os.remove(jpath)
+    assert "CACHED THING" not in statuses
+
+
+def test_status_file_flush():
+    jpath = os.path.join(here, "sample_flush_status_file")
+    with open(jpath, "w") as f:
+        f.write("FIRST THING")
+    with StatusFile(jpath) as status:
+        status.update(message="LATER THING")
+        # additions wait for the flush
+        assert "LATER THING" not in parse_status_file(jpath)
+    statuses = parse_status_file(jpath)
+    os.remove(jpath)
+    assert "LATER THING" in statuses
+
+
+def test_status_file_journal():
+    jpath = os.path.join(here, "sample_journal_status_file")
+    with open(jpath, "w") as f:
+        f.write("FIRST THING")
+    update_status_file(jpath, message="SECOND THING")
+    update_status_file(jpath, to_remove=["FIRST THING"])
+    update_status_file(jpath, message="FIRST THING")
+    update_status_file(jpath, to_remove=["SECOND THING"])
+    with open(jpath, "r") as f:
+        lines = f.read().splitlines()
+    os.remove(jpath)
+    # nothing gets rewritten, just appended
+    assert lines == ["FIRST THING", "SECOND THING", "-FIRST THING",
+                     "FIRST THING", "-SECOND THING"]
+
+
+def test_status_file_has():
+    jpath = os.path.join(here, "sample_has_status_file")
+    with open(jpath, "w") as f:
+        f.write("FIRST THING\nSECOND THING\n-FIRST THING\n")
+    assert status_file_has(jpath, "SECOND THING")
+    # the status is in the file, but has since been removed
+    assert not status_file_has(jpath, "FIRST THING")
+    assert not status_file_has(jpath, "THIRD THING")
+    os.remove(jpath)
+    assert not status_file_has(jpath, "SECOND THING")
+
+
+def test_status_file_compaction():
+    jpath = os.path.join(here, "sample_compact_status_file")
+    with open(jpath, "w") as f:
+        f.write("FIRST THING\n")
+        for i in range(StatusFile.compact_after):
+            f.write("SECOND THING\n-SECOND THING\n")
+    status = StatusFile(jpath)
+    with open(jpath, "r") as f:
+        lines = f.read().splitlines()
+    os.remove(jpath)
+    assert "FIRST THING" in status
+    assert lines == ["FIRST THING"]
+
+
+def test_parse_status_file_changed():
+    jpath = os.path.join(here, "sample_changed_status_file")
+    with open(jpath, "w") as f:
+        f.write("FIRST THING\n")
+    assert parse_status_file(jpath) == ["FIRST THING"]
+    # changes made behind our back show up too
+    with open(jpath, "w") as f:
+        f.write("FIRST THING\nSECOND THING\n")
+    assert parse_status_file(jpath) == ["FIRST THING", "SECOND THING"]
+    os.remove(jpath)
+    assert parse_status_file(jpath) == []
+
+
+def teardown_module():
+    if os.path.exists(fpath):
+        os.remove(fpath)